@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.retrievers import BaseRetriever
+
+import src.global_config as global_config
+import src.rag.llm.rerank_model as rerank_model
+import src.run as run
+from src import constant
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 文档中没有相关内容时写入的答案，与 result.json 一致
+NO_ANSWER = "无答案"
+
+
+def load_questions(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [record["question"] for record in json.load(f)]
+
+
+def load_checkpoint(path: str, questions: list[str]) -> dict[int, list[str]]:
+    """读取已完成问题的答案，问题文本与当前问题集不一致的记录忽略"""
+    done: dict[int, list[str]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程中断时最后一行可能不完整
+                continue
+            index = record["index"]
+            if index < len(questions) and questions[index] == record["question"]:
+                done[index] = record["answers"]
+    return done
+
+
+def write_results(path: str, questions: list[str], done: dict[int, list[str]]):
+    """按 result.json 格式写出，未完成的问题答案为空，先写临时文件再替换"""
+    records = []
+    for index, question in enumerate(questions):
+        answers = done.get(index)
+        record = {"question": question}
+        if answers is None:
+            record["answer_1"] = ""
+        else:
+            for i, answer in enumerate(answers or [NO_ANSWER], start=1):
+                record[f"answer_{i}"] = answer
+        records.append(record)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def prewarm_query_embeddings(retriever: BaseRetriever, questions: list[str], batch_size: int = 64):
+    """对称模型的查询向量以批量方式预先计算并写入缓存，检索时直接命中
+
+    CachedEmbeddings 与 MicroBatchEmbeddings 均提供 embed_queries，其他嵌入模型不预热。
+    """
+    embeddings = getattr(getattr(retriever, "vector_store", None), "embeddings", None)
+    if not hasattr(embeddings, "embed_queries"):
+        return
+    for i in range(0, len(questions), batch_size):
+        embeddings.embed_queries(questions[i:i + batch_size])
+
+
+class BatchRunner:
+    """批量问答
+
+    检索器只加载一次；问题在线程池中并发生成候选答案（检索 + 主题提取 + HyDE），
+    所有 LLM 调用共享一个限流器；完成的问题凑满 rerank_size 个后统一重排序，
+    结果逐条追加到进度文件，并定期重写输出文件（默认 batch_result.json，不覆盖参考答案 result.json）。
+    中断后重新运行会跳过已完成的问题。
+    """
+
+    def __init__(self, retriever: BaseRetriever, concurrency: int = None, requests_per_second: float = None,
+                 rerank_size: int = None, checkpoint_path: str = None, output_path: str = None):
+        self.retriever = retriever
+        self.concurrency = concurrency or constant.batch_concurrency
+        self.rerank_size = rerank_size or constant.batch_rerank_size
+        self.checkpoint_path = checkpoint_path or constant.batch_checkpoint_path
+        self.output_path = output_path or constant.batch_result_path
+        if os.path.abspath(self.output_path) == os.path.abspath(constant.result_path):
+            raise ValueError(f"Refusing to overwrite the reference answers: {constant.result_path}")
+
+        rate_limiter = InMemoryRateLimiter(
+            requests_per_second=requests_per_second or constant.llm_requests_per_second,
+            check_every_n_seconds=0.05,
+            max_bucket_size=self.concurrency,
+        )
+        self.chat_model = global_config.llm.model_copy(update={"rate_limiter": rate_limiter})
+
+    def _candidates(self, question: str) -> list[str]:
+        return run.answer_candidates(question, self.retriever, self.chat_model)
+
+    def _rerank(self, pending: list[tuple[int, str, list[str]]], done: dict[int, list[str]], checkpoint):
+        with_content = [(index, question, contents) for index, question, contents in pending if contents]
+        ranked = rerank_model.rerank_batch([question for _, question, _ in with_content],
+                                           [contents for _, _, contents in with_content])
+        answers = {index: [content for content, _ in scored] for (index, _, _), scored in zip(with_content, ranked)}
+
+        for index, question, _ in pending:
+            done[index] = answers.get(index, [])
+            checkpoint.write(json.dumps({"index": index, "question": question, "answers": done[index]},
+                                        ensure_ascii=False) + "\n")
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+    def run(self, questions: list[str]) -> dict[int, list[str]]:
+        start = time.perf_counter()
+        done = load_checkpoint(self.checkpoint_path, questions)
+        todo = [(index, question) for index, question in enumerate(questions) if index not in done]
+        logger.info(f"[batch] 共 {len(questions)} 个问题，已完成 {len(done)} 个，待处理 {len(todo)} 个")
+
+        prewarm_query_embeddings(self.retriever, [question for _, question in todo])
+
+        failed = 0
+        pending: list[tuple[int, str, list[str]]] = []
+        with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-qa") as executor:
+            futures = {executor.submit(self._candidates, question): (index, question) for index, question in todo}
+            for future in as_completed(futures):
+                index, question = futures[future]
+                try:
+                    pending.append((index, question, future.result()))
+                except Exception:
+                    # 失败的问题不写入进度文件，下次运行时重试
+                    failed += 1
+                    logger.exception(f"[batch] 问题 {index} 处理失败: {question}")
+                    continue
+
+                if len(pending) >= self.rerank_size:
+                    self._rerank(pending, done, checkpoint)
+                    pending = []
+                    write_results(self.output_path, questions, done)
+                    logger.info(f"[batch] 进度 {len(done)}/{len(questions)}，"
+                                f"耗时 {time.perf_counter() - start:.1f}s")
+
+            if pending:
+                self._rerank(pending, done, checkpoint)
+
+        write_results(self.output_path, questions, done)
+        logger.info(f"[batch] 完成 {len(done)}/{len(questions)}，失败 {failed} 个，"
+                    f"总耗时 {time.perf_counter() - start:.1f}s")
+        return done
+
+
+def run_batch(question_path: str = None, force_reindex: bool = False) -> dict[int, list[str]]:
+    questions = load_questions(question_path or constant.test_question_path)
+    retriever = run.init_retriever(force=force_reindex)
+    return BatchRunner(retriever).run(questions)
+
+
+if __name__ == '__main__':
+    run_batch()
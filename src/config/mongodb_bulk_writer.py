@@ -0,0 +1,74 @@
+import logging
+import time
+
+from pydantic import BaseModel
+from pymongo import ASCENDING, UpdateOne
+
+from src.config.mongodb_config import MongoConfig
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MongoBulkWriter:
+    """批量写入 MongoDB
+
+    缓冲 pydantic 记录，按 batch_size 以无序 bulk_write upsert 的方式一次写入，
+    以 key_fields 作为 upsert 条件并为其建立唯一索引。
+    """
+
+    def __init__(self, collection_name: str, key_fields: tuple[str, ...] = ("unique_id",), batch_size: int = 1000):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.collection = MongoConfig.get_collection(collection_name)
+        self.key_fields = key_fields
+        self.batch_size = batch_size
+
+        self._buffer: list[UpdateOne] = []
+        self.written = 0
+        self.round_trips = 0
+        self.elapsed = 0.0
+
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """创建 upsert 条件依赖的唯一索引，已存在时为空操作"""
+        self.collection.create_index([(field, ASCENDING) for field in self.key_fields], unique=True)
+
+    def add(self, record: BaseModel):
+        doc = record.model_dump()
+        key = {field: doc[field] for field in self.key_fields}
+        self._buffer.append(UpdateOne(key, {"$set": doc}, upsert=True))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, records):
+        for record in records:
+            self.add(record)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        start = time.perf_counter()
+        self.collection.bulk_write(self._buffer, ordered=False)
+        self.elapsed += time.perf_counter() - start
+
+        self.written += len(self._buffer)
+        self.round_trips += 1
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        throughput = self.written / self.elapsed if self.elapsed else 0.0
+        logger.info(f"[{self.collection.name}] 写入 {self.written} 条, {self.round_trips} 次请求, "
+                    f"耗时 {self.elapsed:.2f}s, {throughput:.0f} 条/秒")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # 出现异常时不再写入剩余缓冲
+        if exc_type is None:
+            self.close()
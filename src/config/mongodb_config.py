@@ -1,7 +1,9 @@
 import os
+import threading
+
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ConfigurationError
+
+from src.config.resource_registry import registry
 
 # 加载环境变量
 load_dotenv()
@@ -24,6 +26,7 @@ class MongoConfig:
     # 单例模式
     _client = None
     _db = None
+    _lock = threading.Lock()
 
     @classmethod
     def _build_connection_uri(cls):
@@ -35,9 +38,14 @@ class MongoConfig:
     @classmethod
     def initialize(cls):
         """初始化MongoDB连接"""
-        if cls._client is None:
+        from pymongo import MongoClient
+        from pymongo.errors import ConnectionFailure, ConfigurationError
+
+        with cls._lock:
+            if cls._client is not None:
+                return
             try:
-                cls._client = MongoClient(
+                client = MongoClient(
                     cls._build_connection_uri(),
                     maxPoolSize=cls._max_pool_size,
                     connectTimeoutMS=cls._connect_timeout,
@@ -45,9 +53,10 @@ class MongoConfig:
                     serverSelectionTimeoutMS=5000
                 )
 
-                # 验证连接
-                cls._client.admin.command('ping')
-                cls._db = cls._client[cls._db_name]
+                # 验证连接，成功后再对其他线程可见
+                client.admin.command('ping')
+                cls._db = client[cls._db_name]
+                cls._client = client
                 print("Successfully connected to MongoDB")
 
             except ConfigurationError as e:
@@ -60,7 +69,7 @@ class MongoConfig:
     @classmethod
     def get_db(cls):
         """获取数据库实例"""
-        if cls._client is None:
+        if cls._db is None:
             cls.initialize()
         return cls._db
 
@@ -79,5 +88,5 @@ class MongoConfig:
             print("MongoDB connection closed")
 
 
-# 应用启动时初始化连接
-MongoConfig.initialize()
\ No newline at end of file
+# 首次获取集合时才连接，常驻服务可通过 registry.warmup 预先连接
+registry.register("mongo", MongoConfig.get_db)
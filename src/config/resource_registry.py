@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """首次使用时才构建的资源（模型、客户端等），构建过程线程安全且只执行一次"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.load_seconds: float | None = None
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    logger.info(f"[resource] {self.name} 加载耗时 {self.load_seconds:.2f}s")
+        return self._value
+
+
+class ResourceRegistry:
+    """全局资源注册表
+
+    各模块在导入时只登记资源的构建函数，不做任何连接或模型加载；
+    常驻服务启动时调用 warmup 预先加载，命令行与测试只为实际用到的资源付出代价。
+    """
+
+    def __init__(self):
+        self._resources: dict[str, LazyResource] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyResource:
+        with self._lock:
+            if name in self._resources:
+                raise ValueError(f"Resource already registered: {name}")
+            resource = self._resources[name] = LazyResource(name, factory)
+        return resource
+
+    def get(self, name: str):
+        return self._resources[name].get()
+
+    def names(self) -> list[str]:
+        return list(self._resources)
+
+    def warmup(self, names: list[str] = None, max_workers: int = 4) -> dict[str, float]:
+        """并行加载资源，返回各资源的加载耗时
+
+        应显式传入实际需要的资源名：默认的全部已登记资源包含所有已导入模块登记的资源
+        （如建索引时导入 pdf_parse 登记的 mongo）。
+        资源之间的依赖通过各自的锁串行化，被依赖的资源只会加载一次。
+        单个资源加载失败只记录日志，该资源在首次使用时会再次尝试加载。
+        """
+        resources = [self._resources[name] for name in (names or self.names())]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup") as executor:
+            futures = {executor.submit(resource.get): resource for resource in resources}
+            failed = []
+            for future, resource in futures.items():
+                try:
+                    future.result()
+                except Exception:
+                    failed.append(resource.name)
+                    logger.exception(f"[resource] {resource.name} 预热失败")
+        logger.info(f"[resource] 预热 {len(resources)} 个资源，失败 {len(failed)} 个{failed or ''}，"
+                    f"总耗时 {time.perf_counter() - start:.2f}s")
+        return self.timings()
+
+    def timings(self) -> dict[str, float | None]:
+        """各资源的加载耗时，未加载的为 None"""
+        return {name: resource.load_seconds for name, resource in self._resources.items()}
+
+
+registry = ResourceRegistry()
+
+
+def lazy_module_attrs(module_name: str, resources: dict[str, LazyResource]):
+    """生成模块级 __getattr__，使 module.attr 形式的访问按需加载资源
+
+    用法：在模块末尾 __getattr__ = lazy_module_attrs(__name__, {"model": _model})
+    """
+
+    def __getattr__(name: str):
+        resource = resources.get(name)
+        if resource is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        return resource.get()
+
+    return __getattr__
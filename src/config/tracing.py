@@ -0,0 +1,354 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src import constant
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # 各桶内（非累计）的观测数，最后一个为 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result, total = [], 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "avg": self.sum / self.count if self.count else 0.0,
+                "buckets": dict(self.cumulative())}
+
+
+def _label_key(labels: dict[str, Any]) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key: tuple, extra: tuple = ()) -> str:
+    pairs = [*label_key, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """进程内指标：直方图与计数器，按标签区分，可导出 Prometheus 文本格式与 JSON"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: dict[str, dict[tuple, _Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, metric: str, help_text: str):
+        self._help[metric] = help_text
+
+    def observe(self, metric: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(metric, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, metric: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(metric, {})
+            series[key] = series.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": {name: [{"labels": dict(key), **histogram.to_dict()}
+                                      for key, histogram in sorted(series.items())]
+                               for name, series in self._histograms.items()},
+                "counters": {name: [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+                             for name, series in self._counters.items()},
+            }
+
+
+metrics = MetricsRegistry()
+metrics.describe("rag_stage_seconds", "各阶段耗时（秒）")
+metrics.describe("rag_request_seconds", "单次请求总耗时（秒）")
+metrics.describe("rag_llm_tokens_total", "LLM 调用消耗的 token 数")
+metrics.describe("rag_stage_errors_total", "各阶段异常次数")
+
+
+class RequestTrace:
+    """一次请求内各阶段的耗时明细"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: list[dict] = []
+        self.seconds: float | None = None
+        self.profile_path: str | None = None
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "seconds": self.seconds, "spans": self.spans, "profile": self.profile_path}
+
+
+_current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+def record(stage: str, seconds: float, status: str = "ok", **labels):
+    """记录一个阶段的耗时，同时追加到当前请求的明细中"""
+    metrics.observe("rag_stage_seconds", seconds, stage=stage, **labels)
+    if status != "ok":
+        metrics.inc("rag_stage_errors_total", stage=stage, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        # list.append 是原子操作，线程池中的阶段也可以直接追加
+        trace.spans.append({"stage": stage, "ms": round(seconds * 1000, 2), "status": status, **labels})
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """统计 with 块的耗时，例如 with tracing.span("rerank"): ..."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, status, **labels)
+
+
+# 同一时刻只允许一个 cProfile 生效，其余请求跳过采样
+_profile_lock = threading.Lock()
+
+
+def sample_profile() -> bool:
+    """按 constant.trace_profile_sample_rate 抽样决定是否对本次请求做 cProfile"""
+    return constant.trace_profile_sample_rate > 0 and random.random() < constant.trace_profile_sample_rate
+
+
+@contextmanager
+def profile_block(name: str, min_seconds: float = 0.0):
+    """对 with 块做 cProfile，耗时不低于 min_seconds 时保存到 constant.trace_profile_dir
+
+    cProfile 只覆盖当前线程，只能包裹同步代码：在事件循环上跨 await 使用会混入其他协程，
+    且漏掉 to_thread 中的工作。同一时刻只有一个块被采样，其余直接执行。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        seconds = time.perf_counter() - start
+        if seconds >= min_seconds:
+            path = _save_profile(name, seconds, profiler)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.profile_path = path
+
+
+@contextmanager
+def trace_request(name: str, profile: bool = None):
+    """收集一次请求内所有阶段的耗时，只能用于同步调用链
+
+    profile 为 True 时对本次请求做 cProfile 并保存；为 None 时按 constant.trace_profile_sample_rate 抽样，
+    抽样到的请求只有耗时超过 constant.trace_slow_seconds 才保存；为 False 时不采样。
+    已处于另一请求的追踪中时（例如常驻服务在线程中调用），沿用外层的明细与耗时统计。
+    """
+    if profile is None:
+        profile, min_seconds = sample_profile(), constant.trace_slow_seconds
+    else:
+        min_seconds = 0.0
+    profiling = profile_block(name, min_seconds) if profile else nullcontext()
+
+    outer = _current_trace.get()
+    if outer is not None:
+        with profiling:
+            yield outer
+        return
+
+    trace = RequestTrace(name)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        with profiling:
+            yield trace
+    finally:
+        trace.seconds = time.perf_counter() - start
+        _current_trace.reset(token)
+        metrics.observe("rag_request_seconds", trace.seconds, request=name)
+
+
+@contextmanager
+def trace_async_request(name: str):
+    """异步请求的耗时明细，不做 cProfile；需要采样时在线程中执行同步调用链并使用 profile_block"""
+    trace = RequestTrace(name)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.seconds = time.perf_counter() - start
+        _current_trace.reset(token)
+        metrics.observe("rag_request_seconds", trace.seconds, request=name)
+
+
+def _save_profile(name: str, seconds: float, profiler: cProfile.Profile) -> str:
+    os.makedirs(constant.trace_profile_dir, exist_ok=True)
+    path = os.path.join(constant.trace_profile_dir,
+                        f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms.prof")
+    profiler.dump_stats(path)
+    _rotate_profiles()
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+    logger.info(f"[trace] {name} 耗时 {seconds:.2f}s，profile 已保存: {path}\n{summary.getvalue()}")
+    return path
+
+
+def _rotate_profiles():
+    """只保留最新的 constant.trace_profile_max_files 个 profile 文件"""
+    paths = [os.path.join(constant.trace_profile_dir, file_name)
+             for file_name in os.listdir(constant.trace_profile_dir) if file_name.endswith(".prof")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[constant.trace_profile_max_files:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """通过 LangChain 回调统计 LLM 与检索器的耗时及 token 消耗
+
+    阶段名取运行配置 metadata 中的 stage（子运行会继承），缺省时为 llm / retrieve。
+    """
+
+    # 在触发回调的线程中直接执行，计时不受线程池调度影响
+    run_inline = True
+
+    def __init__(self):
+        self._starts: dict[UUID, tuple[str, float]] = {}
+
+    @staticmethod
+    def _stage(metadata: dict | None, default: str) -> str:
+        return (metadata or {}).get("stage", default)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: dict = None, **kwargs):
+        self._starts[run_id] = (self._stage(metadata, "llm"), time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: dict = None, **kwargs):
+        self._starts[run_id] = (self._stage(metadata, "llm"), time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        stage, start = started
+        record(stage, time.perf_counter() - start, kind="llm")
+        for token_type, count in _token_usage(response).items():
+            metrics.inc("rag_llm_tokens_total", count, stage=stage, type=token_type)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            record(started[0], time.perf_counter() - started[1], "error", kind="llm")
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, metadata: dict = None, **kwargs):
+        self._starts[run_id] = ("retrieve", time.perf_counter())
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            record(started[0], time.perf_counter() - started[1], kind="retriever")
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            record(started[0], time.perf_counter() - started[1], "error", kind="retriever")
+
+
+def _token_usage(response: LLMResult) -> dict[str, int]:
+    """优先读取 llm_output 中的 token_usage（OpenAI），否则汇总消息上的 usage_metadata"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt": usage.get("prompt_tokens", 0), "completion": usage.get("completion_tokens", 0)}
+
+    totals = {"prompt": 0, "completion": 0}
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                totals["prompt"] += usage_metadata.get("input_tokens", 0)
+                totals["completion"] += usage_metadata.get("output_tokens", 0)
+    return {key: value for key, value in totals.items() if value}
+
+
+callback_handler = TracingCallbackHandler()
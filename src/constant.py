@@ -1,13 +1,121 @@
+import os
+
 from src.load_env import get_env_key
 
 # 路径都以 run.py 为参考路径
 image_save_dir = "../manual_images"
 pdf_path = "../data/train_a.pdf"
 faiss_store_path = "manual_text_faiss_index"
+bm25_store_path = "bm25_index"
+# 已索引分块清单，用于增量索引
+index_manifest_path = "index_manifest.json"
 
 API_KEY = get_env_key("ZHI_ZENG_API_KEY")
 BASE_URL = get_env_key("BASE_URL")
 
+# 评测数据
+test_question_path = "../data/test_question.json"
+result_path = "../data/result.json"
+# 批量问答的输出，不覆盖作为参考答案的 result.json
+batch_result_path = "../data/batch_result.json"
+# 主题提取提示词中检索上下文的 token 上限
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+
+# 是否用 HyDE 答案参与检索（需等待 HyDE 生成后再检索，默认两者并行）
+hyde_retrieval = os.getenv("HYDE_RETRIEVAL", "false").lower() in ("1", "true")
+
+# 批量问答的进度文件，每完成一个问题追加一行，中断后据此续跑
+batch_checkpoint_path = "../data/result.checkpoint.jsonl"
+
+# 批量问答: 同时处理的问题数、LLM 每秒请求数上限、凑满多少个问题统一重排序
+batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", 8))
+llm_requests_per_second = float(os.getenv("LLM_REQUESTS_PER_SECOND", 4))
+batch_rerank_size = int(os.getenv("BATCH_RERANK_SIZE", 16))
+
 #  模型路径
 rerank_model_path = "../pre_train_model/bge-reranker-large"
 m3e_large_model_path = "../pre_train_model/m3e-large"
+
+# 向量缓存目录及最大条数（每个模型独立计算）
+embedding_cache_dir = "../embedding_cache"
+embedding_cache_max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+
+# 查询向量化的微批参数
+embed_max_batch_size = int(os.getenv("EMBED_MAX_BATCH_SIZE", 32))
+embed_max_wait_ms = float(os.getenv("EMBED_MAX_WAIT_MS", 5))
+
+# LLM 响应缓存: 二级缓存 auto(优先 Redis，不可用时回退磁盘) / redis / disk
+llm_cache_backend = os.getenv("LLM_CACHE_BACKEND", "auto")
+llm_cache_prefix = os.getenv("LLM_CACHE_PREFIX", "llm_cache")
+llm_cache_path = "../llm_cache/llm_cache.sqlite3"
+# 进程内一级缓存条数、二级缓存默认过期秒数（0 表示不过期）及各命名空间的过期秒数
+llm_cache_max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 2048))
+llm_cache_ttl = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+llm_cache_namespace_ttls = {
+    "hyde": int(os.getenv("LLM_CACHE_TTL_HYDE", 30 * 24 * 3600)),
+    "themes": int(os.getenv("LLM_CACHE_TTL_THEMES", 7 * 24 * 3600)),
+}
+
+# 语义答案缓存: 是否启用、判定为同一问题的最低余弦相似度（m3e-small 查询向量）、缓存条数上限
+# 阈值需先用 python -m src.rag.llm.answer_cache_eval 在手册问题对上校准，默认不启用
+answer_cache_enabled = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true")
+answer_cache_threshold = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+answer_cache_max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1024))
+# 阈值校准用的问题对: 同义改写与相近但不同的问题
+answer_cache_eval_path = "../data/answer_cache_pairs.json"
+
+# 请求级 cProfile: 抽样比例（0 表示只在显式要求时采样）、耗时超过多少秒才保存、保存目录
+trace_profile_sample_rate = float(os.getenv("TRACE_PROFILE_SAMPLE_RATE", 0))
+trace_slow_seconds = float(os.getenv("TRACE_SLOW_SECONDS", 5))
+trace_profile_dir = "../profiles"
+# profile 目录中保留的最多文件数，超出时删除最旧的
+trace_profile_max_files = int(os.getenv("TRACE_PROFILE_MAX_FILES", 50))
+
+# PDF 解析进程数，1 表示单进程顺序解析
+pdf_parse_workers = int(os.getenv("PDF_PARSE_WORKERS", 1))
+
+# MongoDB 批量写入的批大小
+mongo_batch_size = int(os.getenv("MONGO_BATCH_SIZE", 1000))
+
+# 语义切分方式: breakpoint(相邻句子相似度断点) / cluster(层次聚类) / page(整页不分组)
+semantic_chunk_method = os.getenv("SEMANTIC_CHUNK_METHOD", "breakpoint")
+
+# 检索后端: remote(Chroma + Elasticsearch 服务) / local(进程内 FAISS + BM25，无需外部服务)
+retriever_backend = os.getenv("RETRIEVER_BACKEND", "remote")
+
+# BM25 分词器: char_ngram(字符 1-2 gram，无需词典) / jieba(需要安装 jieba)
+bm25_tokenizer = os.getenv("BM25_TOKENIZER", "char_ngram")
+
+# FAISS 使用的嵌入模型: openai / m3e-large（本地模型，local 后端默认使用，无需外部服务）
+faiss_embed_model = os.getenv("FAISS_EMBED_MODEL", "m3e-large" if retriever_backend == "local" else "openai")
+
+# FAISS 索引类型: flat(精确) / ivf / hnsw / ivfpq，均使用归一化内积（余弦相似度）
+faiss_index_type = os.getenv("FAISS_INDEX_TYPE", "flat")
+# IVF 聚类中心数（样本不足时自动减少）与查询时探查的聚类数
+faiss_nlist = int(os.getenv("FAISS_NLIST", 256))
+faiss_nprobe = int(os.getenv("FAISS_NPROBE", 16))
+# HNSW 每个节点的邻居数与查询时的候选队列长度
+faiss_hnsw_m = int(os.getenv("FAISS_HNSW_M", 32))
+faiss_ef_search = int(os.getenv("FAISS_EF_SEARCH", 64))
+# IVF-PQ 子向量个数，需整除向量维度
+faiss_pq_m = int(os.getenv("FAISS_PQ_M", 64))
+
+# 建索引时写入的存储，可选 chroma / es / faiss / bm25 / mongo
+ingest_sinks = os.getenv(
+    "INGEST_SINKS", "faiss,bm25" if retriever_backend == "local" else "chroma,es,mongo"
+).split(",")
+
+# 问答服务: 监听地址（8000 已被 chroma 占用）、同时进行的 LLM 链路数、同时进行的本地模型推理数
+server_host = os.getenv("SERVER_HOST", "0.0.0.0")
+server_port = int(os.getenv("SERVER_PORT", 8080))
+server_llm_concurrency = int(os.getenv("SERVER_LLM_CONCURRENCY", 32))
+server_model_concurrency = int(os.getenv("SERVER_MODEL_CONCURRENCY", 2))
+
+# 推理后端: torch(fp32) / int8(动态量化) / onnx，可按模型单独覆盖
+inference_backend = os.getenv("INFERENCE_BACKEND", "torch")
+rerank_backend = os.getenv("RERANK_BACKEND", inference_backend)
+m3e_backend = os.getenv("M3E_BACKEND", inference_backend)
+# CPU 推理线程数，0 表示使用默认值
+inference_threads = int(os.getenv("INFERENCE_THREADS", 0))
+# onnx 后端导出的模型目录，首次加载时导出，此后直接复用；原模型更新后需删除对应子目录
+onnx_cache_dir = "../onnx_cache"
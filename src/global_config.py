@@ -1,19 +1,98 @@
-import redis
-from langchain_community.cache import RedisCache
-from langchain_core.embeddings import Embeddings
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain.globals import set_llm_cache
+import logging
 
 from src import constant
+from src.config.resource_registry import lazy_module_attrs, registry
 
-llm = ChatOpenAI(api_key=constant.API_KEY, base_url=constant.BASE_URL, verbose=True)
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-embed_model: Embeddings = OpenAIEmbeddings(api_key=constant.API_KEY, base_url=constant.BASE_URL)
 
-redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+def _create_llm():
+    from langchain_openai import ChatOpenAI
 
-set_llm_cache(RedisCache(redis_client))
+    # LLM 调用前先挂上全局缓存
+    _llm_cache.get()
+    return ChatOpenAI(api_key=constant.API_KEY, base_url=constant.BASE_URL, verbose=True)
 
-m3e_large_embed_model = HuggingFaceEmbeddings(model_name=constant.m3e_large_model_path)
+
+def _create_embed_model():
+    from langchain_openai import OpenAIEmbeddings
+
+    from src.rag.llm.embedding_cache import CachedEmbeddings
+
+    openai_embed_model = OpenAIEmbeddings(api_key=constant.API_KEY, base_url=constant.BASE_URL)
+    return CachedEmbeddings(
+        openai_embed_model,
+        model_id=f"openai-{openai_embed_model.model}",
+        cache_dir=constant.embedding_cache_dir,
+        max_entries=constant.embedding_cache_max_entries,
+    )
+
+
+def _create_llm_cache():
+    from langchain.globals import set_llm_cache
+
+    from src.rag.llm.tiered_cache import DiskTier, RedisTier, TieredLLMCache
+    from src.rag.prompt.content_themes_prompt import split_theme_marker
+    from src.rag.prompt.hyde_prompt import hyde_marker
+
+    second_tier = None
+    if constant.llm_cache_backend in ("auto", "redis"):
+        try:
+            import redis
+
+            # 缓存值为压缩后的二进制，不能使用 decode_responses
+            client = redis.Redis(host="localhost", port=6379, db=0)
+            client.ping()
+            second_tier = RedisTier(client, prefix=constant.llm_cache_prefix)
+        except Exception as e:
+            if constant.llm_cache_backend == "redis":
+                raise
+            logger.warning(f"Redis 不可用，LLM 缓存回退到本地磁盘: {e}")
+    if second_tier is None:
+        second_tier = DiskTier(constant.llm_cache_path)
+
+    cache = TieredLLMCache(
+        second_tier,
+        max_entries=constant.llm_cache_max_entries,
+        default_ttl=constant.llm_cache_ttl,
+        # 按提示词中的特征文本区分命名空间
+        namespaces={"hyde": hyde_marker, "themes": split_theme_marker},
+        namespace_ttls=constant.llm_cache_namespace_ttls,
+    )
+    set_llm_cache(cache)
+    return cache
+
+
+def _create_m3e_large_embed_model():
+    from src.rag.llm.batching_embeddings import MicroBatchEmbeddings
+    from src.rag.llm.embedding_cache import CachedEmbeddings
+    from src.rag.llm.inference_backend import load_hf_embeddings
+
+    # 并发查询合并为微批，m3e 为对称模型，查询可直接按文档方式批量编码
+    return MicroBatchEmbeddings(
+        CachedEmbeddings(
+            load_hf_embeddings(constant.m3e_large_model_path, constant.m3e_backend),
+            # 不同推理后端的向量存在差异，缓存按后端分开
+            model_id=f"m3e-large-{constant.m3e_backend}",
+            cache_dir=constant.embedding_cache_dir,
+            max_entries=constant.embedding_cache_max_entries,
+        ),
+        max_batch_size=constant.embed_max_batch_size,
+        max_wait_ms=constant.embed_max_wait_ms,
+    )
+
+
+# 均在首次访问时构建，例如 global_config.llm
+_llm_cache = registry.register("llm_cache", _create_llm_cache)
+_llm = registry.register("llm", _create_llm)
+_embed_model = registry.register("embed_model", _create_embed_model)
+_m3e_large_embed_model = registry.register("m3e_large_embed_model", _create_m3e_large_embed_model)
+
+__getattr__ = lazy_module_attrs(__name__, {
+    "llm_cache": _llm_cache,
+    "llm": _llm,
+    "embed_model": _embed_model,
+    "m3e_large_embed_model": _m3e_large_embed_model,
+})
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src import constant
+from src.config.resource_registry import lazy_module_attrs, registry
+from src.rag.llm.embedding_cache import normalize_text
+from src.rag.retriever.index_manifest import IndexManifest
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 语义检索时取的近邻数，从中选出与当前链路配置相同的最相近条目
+_SEARCH_K = 16
+
+
+class _Entry:
+    def __init__(self, entry_id: int, question: str, answers: list[str], scope: str):
+        self.entry_id = entry_id
+        self.question = question
+        self.answers = answers
+        self.scope = scope
+
+
+class SemanticAnswerCache:
+    """语义近重复问题的答案缓存
+
+    问题先按归一化文本精确匹配，未命中时用 m3e 查询向量在内存向量索引中找最相近的已答问题，
+    余弦相似度不低于阈值即返回其重排序后的答案列表。缓存与索引清单绑定，重新建索引后自动清空。
+    scope 标识生成答案的链路配置（检索器、模型、是否 HyDE 检索），只在相同 scope 的条目间匹配。
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.92, max_entries: int = 1024,
+                 manifest_path: str = None):
+        """
+        Args:
+            embeddings: 输出归一化向量的查询嵌入模型
+            threshold: 判定为同一问题的最低余弦相似度
+            max_entries: 缓存条数上限，超出时淘汰最久未使用的条目
+            manifest_path: 索引清单路径，清单内容变化时缓存失效
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.manifest_path = manifest_path
+
+        self._index = None
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._by_text: dict[tuple[str, str], int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self._manifest_stat = None
+        self.version = None
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _manifest_version(self) -> str | None:
+        """索引清单的摘要，清单文件未变化时不重复读取"""
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return None
+        stat = os.stat(self.manifest_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key != self._manifest_stat:
+            manifest = IndexManifest.load(self.manifest_path)
+            digest = hashlib.sha256()
+            digest.update(f"{manifest.source_hash}\0{sorted(manifest.sinks or [])}".encode("utf-8"))
+            for chunk_id in sorted(manifest.chunks):
+                digest.update(chunk_id.encode("utf-8"))
+            self._manifest_stat = stat_key
+            self.version = digest.hexdigest()[:16]
+        return self.version
+
+    def _check_version(self):
+        previous = self.version
+        if self._manifest_version() != previous and self._entries:
+            logger.info(f"[answer_cache] 索引已更新 ({previous} -> {self.version})，清空 {len(self._entries)} 条缓存")
+            self._reset()
+
+    def _reset(self):
+        self._index = None
+        self._entries.clear()
+        self._by_text.clear()
+
+    def _ensure_index(self, dim: int):
+        if self._index is None:
+            import faiss
+
+            # 条目数较小，精确内积检索即可在亚毫秒内完成；IDMap 支持按 id 淘汰
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        return self._index
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray([self.embeddings.embed_query(question)], dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _touch(self, entry: _Entry) -> list[str]:
+        self._entries.move_to_end(entry.entry_id)
+        return list(entry.answers)
+
+    def lookup(self, question: str, scope: str = "") -> list[str] | None:
+        start = time.perf_counter()
+        key = (scope, normalize_text(question))
+        with self._lock:
+            self._check_version()
+            entry_id = self._by_text.get(key)
+            if entry_id is not None:
+                self.hits += 1
+                return self._touch(self._entries[entry_id])
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+        vector = self._embed(question)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+            scores, ids = self._index.search(vector, min(_SEARCH_K, self._index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self._entries.get(int(entry_id))
+                if entry is None or entry.scope != scope:
+                    continue
+                if score < self.threshold:
+                    break
+                self.hits += 1
+                self.semantic_hits += 1
+                logger.info(f"[answer_cache] 命中 {question!r} ≈ {entry.question!r} "
+                            f"(相似度 {score:.3f}, {(time.perf_counter() - start) * 1000:.1f}ms)")
+                return self._touch(entry)
+            self.misses += 1
+            return None
+
+    def update(self, question: str, answers: list[str], scope: str = ""):
+        if not answers:
+            return
+        key = (scope, normalize_text(question))
+        vector = self._embed(question)
+        with self._lock:
+            self._check_version()
+            if key in self._by_text:
+                entry = self._entries[self._by_text[key]]
+                entry.answers = list(answers)
+                self._touch(entry)
+                return
+
+            index = self._ensure_index(vector.shape[1])
+            entry = _Entry(self._next_id, question, list(answers), scope)
+            self._next_id += 1
+            index.add_with_ids(vector, np.asarray([entry.entry_id], dtype="int64"))
+            self._entries[entry.entry_id] = entry
+            self._by_text[key] = entry.entry_id
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                index.remove_ids(np.asarray([evicted.entry_id], dtype="int64"))
+                self._by_text.pop((evicted.scope, normalize_text(evicted.question)), None)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "version": self.version,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _create_answer_cache():
+    import src.rag.llm.m3e_small_model as m3e_small_model
+
+    return SemanticAnswerCache(
+        m3e_small_model.cached_embedding_model,
+        threshold=constant.answer_cache_threshold,
+        max_entries=constant.answer_cache_max_entries,
+        manifest_path=constant.index_manifest_path,
+    )
+
+
+# 首次使用时加载 m3e-small，例如 answer_cache.answer_cache
+_answer_cache = registry.register("answer_cache", _create_answer_cache)
+
+__getattr__ = lazy_module_attrs(__name__, {
+    "answer_cache": _answer_cache,
+})
@@ -0,0 +1,87 @@
+"""在手册问题对上校准语义答案缓存的相似度阈值
+
+问题对来自 constant.answer_cache_eval_path，same 为 True 的是同义改写，False 的是主题相近但答案不同的问题。
+用与答案缓存相同的 m3e-small 查询向量计算每对问题的余弦相似度，报告各阈值下的命中率（同义对）
+与误命中数（非同义对），并给出不产生误命中的最低阈值。
+
+用法: python -m src.rag.llm.answer_cache_eval
+"""
+import json
+import logging
+import math
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src import constant
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_pairs(path: str = constant.answer_cache_eval_path) -> list[tuple[str, str, bool]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [(record["question_1"], record["question_2"], record["same"]) for record in json.load(f)]
+
+
+def pair_similarities(embeddings: Embeddings, pairs: list[tuple[str, str, bool]]) -> np.ndarray:
+    """每对问题查询向量的余弦相似度，与 SemanticAnswerCache 相同按 embed_query 编码并归一化"""
+    vectors = {}
+    for question in {q for q1, q2, _ in pairs for q in (q1, q2)}:
+        vector = np.asarray(embeddings.embed_query(question), dtype="float32")
+        norm = np.linalg.norm(vector)
+        vectors[question] = vector / norm if norm else vector
+    return np.asarray([float(vectors[q1] @ vectors[q2]) for q1, q2, _ in pairs])
+
+
+def threshold_report(similarities: np.ndarray, labels: np.ndarray, thresholds) -> list[dict]:
+    """各阈值下同义对的召回率与非同义对的误命中数"""
+    report = []
+    for threshold in thresholds:
+        matched = similarities >= threshold
+        report.append({
+            "threshold": round(float(threshold), 3),
+            "recall": float(matched[labels].mean()) if labels.any() else 0.0,
+            "false_positives": int(matched[~labels].sum()),
+        })
+    return report
+
+
+def recommend_threshold(similarities: np.ndarray, labels: np.ndarray, step: float = 0.01) -> float:
+    """所有非同义对都不会命中的最低阈值，按 step 向上取整"""
+    if not (~labels).any():
+        raise ValueError("At least one non-paraphrase pair is required to calibrate the threshold")
+    return round(math.floor(similarities[~labels].max() / step + 1) * step, 6)
+
+
+def run_eval(embeddings: Embeddings = None, path: str = constant.answer_cache_eval_path) -> dict:
+    if embeddings is None:
+        import src.rag.llm.m3e_small_model as m3e_small_model
+
+        embeddings = m3e_small_model.cached_embedding_model
+
+    pairs = load_pairs(path)
+    similarities = pair_similarities(embeddings, pairs)
+    labels = np.asarray([same for _, _, same in pairs], dtype=bool)
+
+    for (q1, q2, same), similarity in sorted(zip(pairs, similarities), key=lambda item: -item[1]):
+        logger.info(f"[answer_cache_eval] {similarity:.3f} {'同义' if same else '不同'} {q1!r} / {q2!r}")
+
+    recommended = recommend_threshold(similarities, labels)
+    thresholds = sorted({constant.answer_cache_threshold, recommended, *np.arange(0.80, 0.991, 0.02).round(3)})
+    result = {
+        "pairs": len(pairs),
+        "paraphrase_similarity": {"min": float(similarities[labels].min()), "mean": float(similarities[labels].mean())},
+        "non_paraphrase_similarity": {"max": float(similarities[~labels].max()),
+                                      "mean": float(similarities[~labels].mean())},
+        "current_threshold": constant.answer_cache_threshold,
+        "recommended_threshold": recommended,
+        "report": threshold_report(similarities, labels, thresholds),
+    }
+    logger.info(f"[answer_cache_eval] {json.dumps(result, ensure_ascii=False, indent=2)}")
+    return result
+
+
+if __name__ == '__main__':
+    run_eval()
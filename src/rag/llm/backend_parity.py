@@ -0,0 +1,145 @@
+"""对比不同推理后端与 fp32 的一致性、延迟与内存
+
+以 test_question.json 中的问题、result.json 中该问题的多条答案作为候选集：
+    - reranker: 排序一致率（top1 / 两两顺序一致比例）与分数差
+    - m3e 编码器: 与 fp32 向量的余弦相似度，以及按问题相似度排序的 top1 一致率
+
+用法: python -m src.rag.llm.backend_parity int8
+"""
+import gc
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from src import constant
+from src.rag.llm.inference_backend import BACKENDS, load_sentence_transformer, load_sequence_classifier
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _rss_mb() -> float:
+    """当前进程常驻内存（MB），仅支持 Linux"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def load_candidates(question_path: str = constant.test_question_path,
+                    answer_path: str = constant.result_path) -> list[tuple[str, list[str]]]:
+    """评测问题及其候选答案，答案不足两条的问题跳过"""
+    with open(question_path, "r", encoding="utf-8") as f:
+        questions = [record["question"] for record in json.load(f)]
+    with open(answer_path, "r", encoding="utf-8") as f:
+        answers_by_question = {
+            record["question"]: [value for key, value in record.items() if key.startswith("answer_") and value]
+            for record in json.load(f)
+        }
+
+    samples = []
+    for question in questions:
+        answers = answers_by_question.get(question, [])
+        if len(answers) >= 2:
+            samples.append((question, answers))
+    return samples
+
+
+def pairwise_agreement(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """两组分数给出的两两相对顺序一致的比例"""
+    ref_diff = np.sign(reference[:, None] - reference[None, :])
+    cand_diff = np.sign(candidate[:, None] - candidate[None, :])
+    mask = ~np.eye(len(reference), dtype=bool)
+    return float((ref_diff == cand_diff)[mask].mean())
+
+
+def _load_timed(loader, *args):
+    gc.collect()
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    model = loader(*args)
+    return model, time.perf_counter() - start, _rss_mb() - rss_before
+
+
+def compare_reranker(backend: str, samples: list[tuple[str, list[str]]]) -> dict:
+    import src.rag.llm.rerank_model as rerank_model
+
+    reference_model, _, reference_mem = _load_timed(load_sequence_classifier, rerank_model.model_path, "torch")
+    candidate_model, _, candidate_mem = _load_timed(load_sequence_classifier, rerank_model.model_path, backend)
+
+    top1, agreements, deltas = [], [], []
+    latency = {"torch": 0.0, backend: 0.0}
+    for question, answers in samples:
+        start = time.perf_counter()
+        reference = rerank_model.compute_scores(question, answers, reference_model)
+        latency["torch"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidate = rerank_model.compute_scores(question, answers, candidate_model)
+        latency[backend] += time.perf_counter() - start
+
+        top1.append(reference.argmax() == candidate.argmax())
+        agreements.append(pairwise_agreement(reference, candidate))
+        deltas.append(np.abs(reference - candidate))
+
+    deltas = np.concatenate(deltas)
+    return {
+        "model": "bge-reranker-large",
+        "top1_agreement": float(np.mean(top1)),
+        "pairwise_agreement": float(np.mean(agreements)),
+        "score_delta_mean": float(deltas.mean()),
+        "score_delta_max": float(deltas.max()),
+        "latency_s": latency,
+        "load_rss_mb": {"torch": reference_mem, backend: candidate_mem},
+    }
+
+
+def compare_encoder(name: str, model_path: str, backend: str, samples: list[tuple[str, list[str]]]) -> dict:
+    reference_model, _, reference_mem = _load_timed(load_sentence_transformer, model_path, "torch")
+    candidate_model, _, candidate_mem = _load_timed(load_sentence_transformer, model_path, backend)
+
+    cosines, top1 = [], []
+    latency = {"torch": 0.0, backend: 0.0}
+    for question, answers in samples:
+        texts = [question] + answers
+        start = time.perf_counter()
+        reference = reference_model.encode(texts, normalize_embeddings=True)
+        latency["torch"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidate = candidate_model.encode(texts, normalize_embeddings=True)
+        latency[backend] += time.perf_counter() - start
+
+        cosines.append(np.einsum("ij,ij->i", reference, candidate))
+        top1.append((reference[1:] @ reference[0]).argmax() == (candidate[1:] @ candidate[0]).argmax())
+
+    cosines = np.concatenate(cosines)
+    return {
+        "model": name,
+        "top1_agreement": float(np.mean(top1)),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "latency_s": latency,
+        "load_rss_mb": {"torch": reference_mem, backend: candidate_mem},
+    }
+
+
+def run_parity(backend: str) -> list[dict]:
+    if backend == "torch":
+        raise ValueError("Choose a non-fp32 backend to compare against torch")
+    samples = load_candidates()
+    reports = [
+        compare_reranker(backend, samples),
+        compare_encoder("m3e-small", "moka-ai/m3e-small", backend, samples),
+        compare_encoder("m3e-large", constant.m3e_large_model_path, backend, samples),
+    ]
+    for report in reports:
+        logger.info(f"[parity] {json.dumps(report, ensure_ascii=False, indent=2)}")
+    return reports
+
+
+if __name__ == '__main__':
+    run_parity(sys.argv[1] if len(sys.argv) > 1 else BACKENDS[1])
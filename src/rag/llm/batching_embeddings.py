@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """动态微批的 Embeddings 包装
+
+    并发的 embed_query 请求进入队列，由后台线程凑成最多 max_batch_size 条、
+    最多等待 max_wait_ms 毫秒的微批，合并为一次 embed_documents 前向计算，
+    再通过 Future 分发结果。底层模型提供 embed_queries（如 CachedEmbeddings）时按查询批量计算，
+    否则使用 embed_documents。embed_documents 本身已是批量调用，直接透传。
+
+    仅适用于查询与文档编码方式相同的对称模型（如 m3e）。
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._embed_batch = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes: Counter[int] = Counter()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            # 请求方可能已取消，跳过已完成的 Future
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            try:
+                vectors = self._embed_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def submit(self, text: str) -> Future:
+        """提交单条文本，返回其向量的 Future"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """批量计算查询向量，不经过微批队列，用于批量问答前预热"""
+        return self._embed_batch(texts)
+
+    def stats(self) -> dict:
+        """队列深度与批大小统计"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
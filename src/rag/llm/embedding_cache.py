@@ -0,0 +1,216 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 向量矩阵的初始行数，不足时按倍数扩容
+_INITIAL_CAPACITY = 1024
+# 缓存满时一次淘汰的比例，避免每次未命中都重写索引
+_EVICT_FRACTION = 0.1
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：全角转半角、合并空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """带本地磁盘缓存的 Embeddings 包装
+
+    以 (模型标识, 归一化文本哈希) 为键，文档向量存放在内存映射的 float32 矩阵中，
+    键到行号的索引保存在 json 文件中。批量查询只对未命中的文本调用底层模型，
+    未命中结果一次性写入；超过 max_entries 时按最近最少使用一次淘汰 10%。
+    向量立即写入矩阵，索引每新增 save_every 条、每次淘汰或进程退出时落盘。
+
+    查询文本大多只出现一次，查询向量只放在 query_cache_size 条的进程内 LRU 中，不写入磁盘缓存。
+
+    目录结构：
+        {cache_dir}/{model_id}/vectors.f32  向量矩阵
+        {cache_dir}/{model_id}/index.json   维度、容量、键 -> 行号（按最近访问顺序）
+    """
+
+    def __init__(self, embeddings: Embeddings, model_id: str, cache_dir: str = "embedding_cache",
+                 max_entries: int = 200_000, save_every: int = 1024, query_cache_size: int = 4096):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.save_every = save_every
+        self.query_cache_size = query_cache_size
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_id))
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._matrix_path = os.path.join(self.dir, "vectors.f32")
+        self._index_path = os.path.join(self.dir, "index.json")
+
+        self.dim: int | None = None
+        self.capacity = 0
+        self._matrix: np.memmap | None = None
+        # 键 -> 行号，按最近访问顺序排列（最久未访问的在前）
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        self._free_rows: list[int] = []
+        self._unsaved = 0
+        self._queries: OrderedDict[str, list[float]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self._load()
+        atexit.register(self.flush)
+
+    # ===== 持久化 =====
+
+    def _load(self):
+        if not os.path.exists(self._index_path) or not os.path.exists(self._matrix_path):
+            return
+        with open(self._index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.dim = index["dim"]
+        self.capacity = index["capacity"]
+        rows = index["rows"]
+        if rows and isinstance(next(iter(rows.values())), list):
+            # 旧格式：键 -> [行号, 访问时钟]
+            rows = {key: row for key, (row, _) in sorted(rows.items(), key=lambda item: item[1][1])}
+        self._rows = OrderedDict(rows)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+        used = set(self._rows.values())
+        self._free_rows = [row for row in range(self.capacity) if row not in used]
+
+    def flush(self):
+        """将索引落盘"""
+        with self._lock:
+            if self._unsaved:
+                self._save_index()
+
+    def _save_index(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "rows": self._rows}, f)
+        os.replace(tmp_path, self._index_path)
+        self._unsaved = 0
+
+    def _ensure_capacity(self, required: int):
+        """保证空闲行不少于 required，必要时扩容矩阵"""
+        if len(self._free_rows) >= required:
+            return
+        new_capacity = max(_INITIAL_CAPACITY, self.capacity * 2, self.capacity + required - len(self._free_rows))
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        # 按新大小扩展文件，已有数据保持不变
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self._free_rows.extend(range(self.capacity, new_capacity))
+        self.capacity = new_capacity
+
+    def _evict(self, incoming: int) -> int:
+        """为 incoming 条新数据腾出空间，一次淘汰至少 10% 最近最少使用的条目，返回淘汰数量"""
+        overflow = len(self._rows) + incoming - self.max_entries
+        if overflow <= 0:
+            return 0
+        count = min(len(self._rows), max(overflow, int(self.max_entries * _EVICT_FRACTION)))
+        for _ in range(count):
+            _, row = self._rows.popitem(last=False)
+            self._free_rows.append(row)
+        logger.info(f"[{self.model_id}] 嵌入缓存淘汰 {count} 条")
+        return count
+
+    # ===== 查询 =====
+
+    def _key(self, text: str, kind: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{kind}\0{normalize_text(text)}".encode("utf-8")).hexdigest()[:32]
+
+    def _embed_cached(self, texts: list[str], kind: str, embed_fn) -> list[list[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        results: list[list[float] | None] = [None] * len(texts)
+
+        # 未命中的文本去重后批量计算
+        missing: dict[str, str] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if kind == "query":
+                    vector = self._queries.get(key)
+                    if vector is not None:
+                        self._queries.move_to_end(key)
+                        results[i] = vector
+                elif key in self._rows:
+                    self._rows.move_to_end(key)
+                    results[i] = self._matrix[self._rows[key]].tolist()
+                if results[i] is None and key not in missing:
+                    missing[key] = texts[i]
+            self.hits += len(texts) - sum(1 for r in results if r is None)
+            self.misses += len(missing)
+
+        if not missing:
+            return results
+
+        vectors = embed_fn(list(missing.values()))
+        computed = dict(zip(missing.keys(), vectors))
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = computed[key]
+
+        if kind == "query":
+            self._remember_queries(computed)
+        else:
+            self._store(computed)
+        return results
+
+    def _remember_queries(self, computed: dict[str, list[float]]):
+        with self._lock:
+            for key, vector in computed.items():
+                self._queries[key] = list(vector)
+                self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def _store(self, computed: dict[str, list[float]]):
+        with self._lock:
+            new_keys = [key for key in computed if key not in self._rows][:self.max_entries]
+            if not new_keys:
+                return
+            if self.dim is None:
+                self.dim = len(computed[new_keys[0]])
+
+            # 被淘汰的行即将被覆盖，先让磁盘索引不再指向它们
+            if self._evict(len(new_keys)):
+                self._save_index()
+            self._ensure_capacity(len(new_keys))
+
+            rows = [self._free_rows.pop() for _ in new_keys]
+            self._matrix[rows] = np.asarray([computed[key] for key in new_keys], dtype=np.float32)
+            for key, row in zip(new_keys, rows):
+                self._rows[key] = row
+
+            self._unsaved += len(new_keys)
+            if self._unsaved >= self.save_every:
+                self._save_index()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed_cached(texts, "doc", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_cached([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """批量计算查询向量并写入进程内查询缓存，底层以一次 embed_documents 完成，仅适用于对称模型"""
+        return self._embed_cached(texts, "query", self.embeddings.embed_documents)
+
+    def __len__(self):
+        return len(self._rows)
@@ -0,0 +1,128 @@
+import logging
+import os
+import re
+import shutil
+from typing import TYPE_CHECKING
+
+from src import constant
+
+if TYPE_CHECKING:
+    import torch
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# torch: fp32 原始模型; int8: 动态 int8 量化 Linear 层; onnx: 导出为 ONNX 由 onnxruntime 推理
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def _check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}, expected one of {BACKENDS}")
+
+
+def configure_threads(num_threads: int = None):
+    """设置 CPU 推理线程数，0 或 None 表示使用 torch 默认值"""
+    import torch
+
+    num_threads = num_threads or constant.inference_threads
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    return torch.get_num_threads()
+
+
+def onnx_export_dir(model_name_or_path: str) -> str:
+    """模型导出为 ONNX 后的缓存目录，每个模型一个子目录"""
+    name = re.sub(r"[^\w.-]", "_", os.path.normpath(model_name_or_path).lstrip("./"))
+    return os.path.join(constant.onnx_cache_dir, name)
+
+
+def _save_onnx_export(model, export_dir: str):
+    """先写入临时目录再改名，避免中断时留下不完整的导出"""
+    tmp_dir = f"{export_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model.save_pretrained(tmp_dir)
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.replace(tmp_dir, export_dir)
+    logger.info(f"ONNX 模型已导出到 {export_dir}")
+
+
+def quantize_int8(model: "torch.nn.Module") -> "torch.nn.Module":
+    """对 Linear 层做动态 int8 量化（原地修改）"""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_sequence_classifier(model_path: str, backend: str = "torch"):
+    """加载序列分类模型（bge reranker）"""
+    _check_backend(backend)
+    configure_threads()
+
+    if backend == "onnx":
+        # 可选依赖，仅在选择 onnx 后端时需要
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        session_options = onnxruntime.SessionOptions()
+        if constant.inference_threads:
+            session_options.intra_op_num_threads = constant.inference_threads
+        export_dir = onnx_export_dir(model_path)
+        if os.path.exists(os.path.join(export_dir, "model.onnx")):
+            return ORTModelForSequenceClassification.from_pretrained(export_dir, session_options=session_options)
+
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_path, export=True, session_options=session_options
+        )
+        _save_onnx_export(model, export_dir)
+        return model
+
+    from transformers import AutoModelForSequenceClassification
+
+    model = AutoModelForSequenceClassification.from_pretrained(pretrained_model_name_or_path=model_path).eval()
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model
+
+
+def load_sentence_transformer(model_name_or_path: str, backend: str = "torch"):
+    """加载 SentenceTransformer 编码模型（m3e）"""
+    _check_backend(backend)
+    configure_threads()
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        # sentence-transformers >= 3.2 内置 onnx 后端，导出结果保存在 onnx/model.onnx
+        export_dir = onnx_export_dir(model_name_or_path)
+        if os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+            return SentenceTransformer(export_dir, backend="onnx")
+        model = SentenceTransformer(model_name_or_path, backend="onnx")
+        _save_onnx_export(model, export_dir)
+        return model
+
+    model = SentenceTransformer(model_name_or_path)
+    if backend == "int8":
+        quantize_int8(model)
+    return model
+
+
+def load_hf_embeddings(model_name_or_path: str, backend: str = "torch"):
+    """加载 langchain HuggingFaceEmbeddings，后端选择同 load_sentence_transformer"""
+    _check_backend(backend)
+    configure_threads()
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_kwargs = {}
+    if backend == "onnx":
+        model_kwargs = {"backend": "onnx"}
+        export_dir = onnx_export_dir(model_name_or_path)
+        if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+            # 首次使用时导出一次
+            load_sentence_transformer(model_name_or_path, backend)
+        model_name_or_path = export_dir
+    embeddings = HuggingFaceEmbeddings(model_name=model_name_or_path, model_kwargs=model_kwargs)
+    if backend == "int8":
+        # HuggingFaceEmbeddings 未暴露底层模型，只能访问私有属性
+        quantize_int8(embeddings._client)
+    return embeddings
@@ -1,21 +1,99 @@
 import math
-from typing import List
-import pandas as pd
+from typing import List, TYPE_CHECKING
+import numpy as np
 
-import torch
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import AgglomerativeClustering
+from langchain_core.embeddings import Embeddings
 
 from src import constant
+from src.config.resource_registry import lazy_module_attrs, registry
+from src.rag.llm.embedding_cache import CachedEmbeddings
+from src.rag.llm.inference_backend import load_sentence_transformer
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
-# Initialize model with GPU support and normalization
-embedding_model = SentenceTransformer("moka-ai/m3e-small")
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """将 SentenceTransformer 适配为 langchain Embeddings，输出归一化向量"""
+
+    def __init__(self, model: "SentenceTransformer", batch_size: int = 256):
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# 模型在首次使用时加载，例如 m3e_small_model.embedding_model
+_embedding_model = registry.register(
+    "m3e_small_model", lambda: load_sentence_transformer("moka-ai/m3e-small", constant.m3e_backend)
+)
+_cached_embedding_model = registry.register(
+    "m3e_small_cached_embeddings",
+    lambda: CachedEmbeddings(
+        SentenceTransformerEmbeddings(_embedding_model.get()),
+        # 不同推理后端的向量存在差异，缓存按后端分开
+        model_id=f"m3e-small-{constant.m3e_backend}",
+        cache_dir=constant.embedding_cache_dir,
+        max_entries=constant.embedding_cache_max_entries,
+    ),
+)
+
+
+def semantic_chunk(documents: List[List[str]], max_group_size: int = 8,
+                   breakpoint_percentile: float = 25) -> List[List[str]]:
+    """按相邻句子的语义相似度断点切分，保持阅读顺序
+
+    所有文档的句子一次性批量编码（经由向量缓存），只计算相邻句子的余弦相似度，时间与内存均为线性。
+    相似度低于本文档相邻相似度分位数阈值处断开，同时每组不超过 max_group_size 句。
+    阈值按文档（页面）单独计算，切分结果只取决于页面自身内容，与同批处理的其他页面无关，
+    保证增量建索引时未变化页面的 chunk_id 不变。
+
+    Args:
+        documents: 每个文档（页面）的句子列表
+        max_group_size: 每组最多的句子数
+        breakpoint_percentile: 断点阈值取相邻相似度的分位数，越大切得越细
+
+    Returns:
+        与 documents 一一对应的分组文本列表
+    """
+    if max_group_size < 1:
+        raise ValueError("max_group_size must be at least 1")
+
+    sentences = [sentence for doc in documents for sentence in doc]
+    if not sentences:
+        return [[] for _ in documents]
+
+    embeddings = np.asarray(_cached_embedding_model.get().embed_documents(sentences), dtype=np.float32)
+    # 第 i 个值为句子 i 与 i+1 的余弦相似度
+    similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+
+    results = []
+    offset = 0
+    for doc in documents:
+        # 只使用本文档内部的相邻相似度，跨文档的相邻句子不参与
+        doc_similarities = similarities[offset:offset + len(doc) - 1]
+        threshold = np.percentile(doc_similarities, breakpoint_percentile) if len(doc_similarities) else -1.0
+
+        groups = []
+        current = []
+        for i, sentence in enumerate(doc):
+            if current and (len(current) >= max_group_size or similarities[offset + i - 1] < threshold):
+                groups.append("\n".join(current))
+                current = []
+            current.append(sentence)
+        if current:
+            groups.append("\n".join(current))
+        results.append(groups)
+        offset += len(doc)
+    return results
 
 
 def semantic_group(sentences: List[str], group_size: int = 5) -> List[str]:
-    """将句子按语义相似性分组
+    """将句子按语义相似性聚类分组（不保持阅读顺序，O(n²)，仅用于与 semantic_chunk 对比）
 
     Args:
         sentences: 待分组的句子列表
@@ -27,6 +105,9 @@ def semantic_group(sentences: List[str], group_size: int = 5) -> List[str]:
     Raises:
         ValueError: 当输入参数不合法时
     """
+    import pandas as pd
+    from sklearn.cluster import AgglomerativeClustering
+
     # 参数校验
     if group_size < 1:
         raise ValueError("group_size must be at least 1")
@@ -40,8 +121,8 @@ def semantic_group(sentences: List[str], group_size: int = 5) -> List[str]:
     # 计算合理的聚类数量（向上取整）
     n_clusters = max(1, math.ceil(len(sentences) / group_size))
 
-    # 生成嵌入向量（已自动使用GPU加速）
-    embeddings = embedding_model.encode(sentences)
+    # 生成嵌入向量（已自动使用GPU加速，经由向量缓存）
+    embeddings = np.asarray(_cached_embedding_model.get().embed_documents(sentences), dtype=np.float32)
 
     # 使用余弦相似度的层次聚类
     clustering = AgglomerativeClustering(
@@ -62,3 +143,9 @@ def semantic_group(sentences: List[str], group_size: int = 5) -> List[str]:
               .agg(lambda x: " ".join(x))
               .to_dict())
     return list(result.values())
+
+
+__getattr__ = lazy_module_attrs(__name__, {
+    "embedding_model": _embedding_model,
+    "cached_embedding_model": _cached_embedding_model,
+})
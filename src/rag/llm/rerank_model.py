@@ -1,20 +1,149 @@
-import torch
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+import heapq
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import src.constant as constant
+from src.config import tracing
+from src.config.resource_registry import LazyResource, lazy_module_attrs, registry
+from src.rag.llm.inference_backend import load_sequence_classifier
+from src.rag.loader.content_hash import stable_hash
 
 model_path = constant.rerank_model_path
 
-tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=model_path)
-model = AutoModelForSequenceClassification.from_pretrained(pretrained_model_name_or_path=model_path)
+
+def _load_tokenizer():
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(pretrained_model_name_or_path=model_path)
+
+
+def _select_device():
+    import torch
+
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+# 均在首次打分时加载，例如 rerank_model.model
+_tokenizer = registry.register("rerank_tokenizer", _load_tokenizer)
+_model = registry.register("rerank_model", lambda: load_sequence_classifier(model_path, constant.rerank_backend))
+_device = LazyResource("rerank_device", _select_device)
 max_length = 512
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# 每个小批次的上限：补齐后的 token 总数与样本数
+max_batch_tokens = 8192
+max_batch_size = 32
+
+# (query, 内容哈希) -> 分数 的 LRU 缓存
+score_cache_size = 4096
+_score_cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+_score_cache_lock = threading.Lock()
+
+
+def _length_buckets(lengths: list[int]) -> list[list[int]]:
+    """按长度排序后切分小批次，每批补齐后的 token 数不超过 max_batch_tokens"""
+    batches = []
+    current = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # 已按长度升序，当前样本即为本批最长
+        if current and (len(current) >= max_batch_size or (len(current) + 1) * lengths[index] > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _score_pairs(queries: list[str], contents: list[str], scoring_model=None) -> np.ndarray:
+    """按长度分桶打分，避免一条长文本让整批都补齐到最大长度"""
+    import torch
+
+    if scoring_model is None:
+        scoring_model = _model.get()
+    if not contents:
+        return np.zeros(0, dtype=np.float32)
+
+    tokenizer, device = _tokenizer.get(), _device.get()
+    encodings = tokenizer(queries, contents, truncation=True, max_length=max_length)
+    keys = list(encodings.keys())
+    scores = np.zeros(len(contents), dtype=np.float32)
+
+    for batch in _length_buckets([len(ids) for ids in encodings["input_ids"]]):
+        features = [{key: encodings[key][i] for key in keys} for i in batch]
+        inputs = tokenizer.pad(features, return_tensors='pt').to(device)
+        with torch.no_grad():
+            logits = scoring_model(**inputs).logits
+        scores[batch] = logits.detach().cpu().numpy().reshape(-1)
+    return scores
+
+
+def compute_scores(query: str, extracted_contents: list[str], scoring_model=None) -> np.ndarray:
+    """计算每条内容与 query 的相关性分数（不经过缓存）
+
+    Args:
+        scoring_model: 用于打分的模型，默认使用本模块加载的模型，便于对比不同推理后端
+    """
+    return _score_pairs([query] * len(extracted_contents), extracted_contents, scoring_model)
+
+
+def _pairs_bucket(count: int) -> str:
+    """打分对数量按数量级分组作为指标标签，避免标签取值过多"""
+    for bound in (8, 32, 128):
+        if count <= bound:
+            return f"<={bound}"
+    return ">128"
+
+
+def rerank_batch(queries: list[str], contents_list: list[list[str]], top_k: int = None) \
+        -> list[list[tuple[str, float]]]:
+    """批量重排序，所有问题的未命中候选合并后统一分桶打分
+
+    Returns:
+        与 queries 一一对应的 [(内容, 分数)] 列表，按分数降序，top_k 不为空时只保留前 top_k 条
+    """
+    keys_list = [[(query, stable_hash(content)) for content in contents]
+                 for query, contents in zip(queries, contents_list)]
+
+    cached: dict[tuple[str, str], float] = {}
+    missing: dict[tuple[str, str], tuple[str, str]] = {}
+    with _score_cache_lock:
+        for query, contents, keys in zip(queries, contents_list, keys_list):
+            for content, key in zip(contents, keys):
+                if key in _score_cache:
+                    _score_cache.move_to_end(key)
+                    cached[key] = _score_cache[key]
+                elif key not in missing:
+                    missing[key] = (query, content)
+
+    if missing:
+        missing_pairs = list(missing.values())
+        with tracing.span("rerank", pairs=_pairs_bucket(len(missing_pairs))):
+            scores = _score_pairs([q for q, _ in missing_pairs], [c for _, c in missing_pairs])
+        computed = dict(zip(missing.keys(), scores.tolist()))
+        cached.update(computed)
+        with _score_cache_lock:
+            _score_cache.update(computed)
+            while len(_score_cache) > score_cache_size:
+                _score_cache.popitem(last=False)
+
+    results = []
+    for contents, keys in zip(contents_list, keys_list):
+        scored = [(content, cached[key]) for content, key in zip(contents, keys)]
+        if top_k is None:
+            results.append(sorted(scored, key=lambda x: x[1], reverse=True))
+        else:
+            results.append(heapq.nlargest(top_k, scored, key=lambda x: x[1]))
+    return results
+
+
+def rerank(query: str, extracted_contents: list[str], top_k: int = None) -> list[tuple[str, float]]:
+    """重排序并返回 [(内容, 分数)]，按分数降序"""
+    return rerank_batch([query], [extracted_contents], top_k)[0]
 
 
 def predict(query: str, extracted_contents: list[str]) -> list[str]:
-    pairs = [(query, content) for content in extracted_contents]
-    inputs = tokenizer(pairs, padding=True, truncation=True, return_tensors='pt', max_length=max_length).to(device)
-    with torch.no_grad():
-        scores = model(**inputs).logits
-    scores = scores.detach().cpu().clone().numpy()
-    response = [doc for score, doc in sorted(zip(scores, extracted_contents), reverse=True, key=lambda x: x[0])]
-    return response
+    return [doc for doc, _ in rerank(query, extracted_contents)]
+
+
+__getattr__ = lazy_module_attrs(__name__, {"tokenizer": _tokenizer, "model": _model, "device": _device})
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import warnings
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _dumps_generations(generations: RETURN_VAL_TYPE) -> bytes:
+    return zlib.compress(json.dumps([dumps(generation) for generation in generations]).encode("utf-8"))
+
+
+def _loads_generations(blob: bytes) -> Optional[RETURN_VAL_TYPE]:
+    try:
+        # loads 仍为 beta 接口，反序列化的是本进程写入的记录，忽略其提示
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return [loads(item) for item in json.loads(zlib.decompress(blob).decode("utf-8"))]
+    except (zlib.error, json.JSONDecodeError, TypeError, ValueError):
+        logger.warning("LLM 缓存中存在无法解析的记录，按未命中处理")
+        return None
+
+
+class _TierStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    def record(self, hit: bool, seconds: float):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.seconds += seconds
+
+    def to_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_ms": self.seconds / lookups * 1000 if lookups else 0.0,
+        }
+
+
+class RedisTier:
+    """Redis 二级缓存，值为压缩后的字节串，按命名空间设置过期时间"""
+    name = "redis"
+
+    def __init__(self, client, prefix: str = "llm_cache"):
+        # client 需使用 decode_responses=False，值为二进制
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: bytes, ttl: int = None):
+        self.client.set(f"{self.prefix}:{key}", value, ex=ttl or None)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.client.delete(*keys[i:i + 1000])
+
+
+class DiskTier:
+    """本地 sqlite 二级缓存，Redis 不可用时使用
+
+    过期记录在读取时忽略，并在打开时及此后每隔 purge_interval 秒的写入时删除。
+    """
+    name = "disk"
+
+    def __init__(self, path: str, purge_interval: int = 3600):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                           "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+        self._lock = threading.Lock()
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        with self._lock:
+            self._purge_expired()
+
+    def _purge_expired(self) -> int:
+        """删除已过期的记录，调用方需持有锁"""
+        now = time.time()
+        self._last_purge = now
+        deleted = self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,)).rowcount
+        if deleted:
+            logger.info(f"[llm_cache] 磁盘缓存清理过期记录 {deleted} 条")
+        return deleted
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: int = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, value, expires_at))
+            if time.time() - self._last_purge >= self.purge_interval:
+                self._purge_expired()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+class TieredLLMCache(BaseCache):
+    """两级 LLM 响应缓存：进程内 LRU -> Redis（或本地磁盘）
+
+    一级缓存命中时不产生任何网络往返；二级缓存的值经 zlib 压缩并设置过期时间，
+    命中后回填一级缓存。键按提示词类型划分命名空间（根据提示词中的特征文本判断），
+    不同命名空间可设置不同的过期时间。
+    """
+
+    def __init__(self, second_tier, max_entries: int = 2048, default_ttl: int = 7 * 24 * 3600,
+                 namespaces: dict[str, str] = None, namespace_ttls: dict[str, int] = None):
+        """
+        Args:
+            second_tier: RedisTier / DiskTier
+            max_entries: 一级缓存条数上限
+            default_ttl: 二级缓存默认过期秒数，0 表示不过期
+            namespaces: 命名空间 -> 提示词特征文本，未匹配的归入 default
+            namespace_ttls: 命名空间 -> 过期秒数，覆盖 default_ttl
+        """
+        self.second_tier = second_tier
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        # 聊天模型的提示词是消息列表的 json，中文被转义，两种形式都匹配
+        self.namespaces = {namespace: (marker, json.dumps(marker)[1:-1])
+                           for namespace, marker in (namespaces or {}).items()}
+        self.namespace_ttls = namespace_ttls or {}
+
+        self._memory: OrderedDict[str, RETURN_VAL_TYPE] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory": _TierStats("memory"), second_tier.name: _TierStats(second_tier.name)}
+
+    def namespace_of(self, prompt: str) -> str:
+        for namespace, markers in self.namespaces.items():
+            if any(marker in prompt for marker in markers):
+                return namespace
+        return "default"
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        digest = hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+        return f"{self.namespace_of(prompt)}:{digest}"
+
+    def _remember(self, key: str, value: RETURN_VAL_TYPE):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+
+        start = time.perf_counter()
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+        self._stats["memory"].record(value is not None, time.perf_counter() - start)
+        if value is not None:
+            return value
+
+        start = time.perf_counter()
+        try:
+            blob = self.second_tier.get(key)
+        except Exception as e:
+            # 二级缓存故障不影响 LLM 调用
+            logger.warning(f"[llm_cache] {self.second_tier.name} 读取失败: {e}")
+            blob = None
+        value = _loads_generations(blob) if blob is not None else None
+        self._stats[self.second_tier.name].record(value is not None, time.perf_counter() - start)
+
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        self._remember(key, return_val)
+        namespace = key.split(":", 1)[0]
+        try:
+            self.second_tier.set(key, _dumps_generations(return_val),
+                                 self.namespace_ttls.get(namespace, self.default_ttl))
+        except Exception as e:
+            logger.warning(f"[llm_cache] {self.second_tier.name} 写入失败: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+        self.second_tier.clear()
+
+    def stats(self) -> dict:
+        """各级缓存的命中、未命中次数与平均查询耗时"""
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
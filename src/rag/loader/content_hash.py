@@ -0,0 +1,18 @@
+import hashlib
+
+# 分块读取文件的大小
+_READ_BLOCK_SIZE = 1 << 20
+
+
+def stable_hash(text: str) -> str:
+    """计算跨进程稳定的内容哈希（内置 hash() 带随机盐，不可复现）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def file_hash(path: str) -> str:
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -1,17 +1,18 @@
-import os
 from typing import Tuple
 
 import fitz
-from pymongo.collection import Collection
 from typing_extensions import List
 
 from src import constant
 from src.base_model.manual_images import ManualImages
 from src.config.mongodb_config import MongoConfig
+from src.config.resource_registry import LazyResource, lazy_module_attrs
+from src.rag.loader.image_store import ImageStore
+from src.rag.loader.page_layout import PageLayout
 
 # 全局配置
-manual_images_collection: Collection = MongoConfig.get_collection("manual_images")
-image_save_dir = constant.image_save_dir
+_manual_images_collection = LazyResource("manual_images_collection",
+                                         lambda: MongoConfig.get_collection("manual_images"))
 pdf_path = constant.pdf_path
 
 # 标题判断配置
@@ -23,24 +24,27 @@ TITLE_PROPERTIES = {
 }
 
 
-def handle_image(img: Tuple, img_index: int, page: fitz.Page) -> ManualImages | None:
-    """处理单个图片"""
+def handle_image(img: Tuple, page: fitz.Page, image_store: ImageStore, layout: PageLayout = None) -> ManualImages | None:
+    """处理单个图片
+
+    Args:
+        image_store: 图片存储，负责去重与异步写盘
+        layout: 页面版面模型，同一页的多张图片应共享同一个实例
+    """
     xref = img[0]
-    base_image = page.parent.extract_image(xref)
 
-    # 跳过小图标
-    if base_image["ext"] == "png" or base_image["width"] <= 34:
+    # 保存图片并获取路径，小图标返回 None
+    image_path = image_store.get_image_path(page, xref)
+    if not image_path:
         return None
 
-    # 保存图片并获取路径
-    image_path = save_image(base_image, img_index, page.number)
-
     # 获取扩展后的图片区域
     img_rect = page.get_image_bbox(img)
     expanded_rect = get_expanded_rect(img_rect, page.rect)
 
     # 获取关联文本块
-    related_blocks = get_related_text_blocks(page, expanded_rect, img_rect.y0)
+    layout = layout or PageLayout(page)
+    related_blocks = get_related_text_blocks(layout, expanded_rect, img_rect.y0)
     title_blocks = [text for is_title, text in related_blocks if is_title]
 
     return ManualImages(
@@ -50,50 +54,36 @@ def handle_image(img: Tuple, img_index: int, page: fitz.Page) -> ManualImages |
     )
 
 
-def save_image(base_image: dict, img_index: int, page_number: int) -> str:
-    """保存图片到本地并返回路径"""
-    image_name = f"page{page_number + 1}_img{img_index + 1}.{base_image['ext']}"
-    image_path = os.path.join(image_save_dir, image_name)
-    with open(image_path, "wb") as f:
-        f.write(base_image["image"])
-    return image_path
-
-
 def get_expanded_rect(img_rect: fitz.Rect, page_rect: fitz.Rect) -> fitz.Rect:
     """获取扩展后的搜索区域"""
     expanded = img_rect + (0, -15, 0, img_rect.height * 3)
     return expanded.intersect(page_rect)
 
 
-def get_related_text_blocks(page: fitz.Page, rect: fitz.Rect, img_y: float) -> List[Tuple[bool, str]]:
+def get_related_text_blocks(layout: PageLayout, rect: fitz.Rect, img_y: float) -> List[Tuple[bool, str]]:
     """获取与图片相关的文本块"""
     related_blocks = []
-    for block in page.get_text("blocks"):
-        block_rect = fitz.Rect(block[:4])
-        if not block_rect.intersects(rect):
-            continue
-
+    for index in layout.intersecting_blocks(rect):
+        block = layout.blocks[index]
         block_text = block[4].strip()
-        above = block_rect.y1 < img_y
-        is_title_block = is_title_block_candidate(page, block, above)
+        above = layout.rects[index].y1 < img_y
+        is_title_block = is_title_block_candidate(layout, block, above)
         related_blocks.append((is_title_block, block_text))
 
     return related_blocks
 
 
-def is_title_block_candidate(page: fitz.Page, block: tuple, above: bool) -> bool:
+def is_title_block_candidate(layout: PageLayout, block: tuple, above: bool) -> bool:
     """判断是否为标题候选块"""
     if block[6] != 0 or not block[4].strip():
         return False
 
-    try:
-        span = page.get_text("dict")["blocks"][block[5]]["lines"][0]["spans"][0]
-    except (IndexError, KeyError):
+    first_span = layout.first_span(block)
+    if first_span is None:
         return False
 
     text = block[4].strip()
-    font_size = span["size"]
-    is_bold = "bold" in span["font"].lower()
+    font_size, is_bold = first_span
 
     # 排除带句尾标点的文本
     if text.endswith(('.', '。', '!', '！')):
@@ -108,3 +98,6 @@ def is_title_block_candidate(page: fitz.Page, block: tuple, above: bool) -> bool
     score += 2 if above else -1
 
     return score >= 3
+
+
+__getattr__ = lazy_module_attrs(__name__, {"manual_images_collection": _manual_images_collection})
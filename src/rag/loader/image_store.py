@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import fitz
+
+from src import constant
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ImageStore:
+    """去重的图片存储
+
+    - 按 xref 缓存解码结果，同一文档内重复引用的图片只解码一次
+    - 按内容哈希命名文件，跨页、跨进程、跨运行的相同图片只写一次，已存在的文件直接跳过
+    - 写盘交给有界的后台线程池，队列满时才阻塞调用方
+
+    页码与图片的对应关系由 page_loader 写入各页 Document 的 images_info，这里不再单独记录。
+
+    非线程安全，由解析线程单独持有；使用结束后需调用 close() 等待写盘完成。
+    """
+
+    def __init__(self, save_dir: str = constant.image_save_dir, max_workers: int = 4, max_pending: int = 64):
+        self.save_dir = save_dir
+        os.makedirs(save_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-writer")
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._futures: list[Future] = []
+
+        # xref -> 图片路径，None 表示被过滤的小图标
+        self._xref_paths: dict[int, str | None] = {}
+        # 内容哈希 -> 图片路径
+        self._hash_paths: dict[str, str] = {}
+
+        self.written = 0
+        self.skipped = 0
+
+    def get_image_path(self, page: fitz.Page, xref: int) -> str | None:
+        """返回图片的存储路径，小图标返回 None"""
+        if xref not in self._xref_paths:
+            self._xref_paths[xref] = self._store(page.parent.extract_image(xref))
+        return self._xref_paths[xref]
+
+    def _store(self, base_image: dict) -> str | None:
+        # 跳过小图标
+        if base_image["ext"] == "png" or base_image["width"] <= 34:
+            return None
+
+        content_hash = hashlib.sha256(base_image["image"]).hexdigest()[:32]
+        if content_hash in self._hash_paths:
+            return self._hash_paths[content_hash]
+
+        image_path = os.path.join(self.save_dir, f"img_{content_hash}.{base_image['ext']}")
+        self._hash_paths[content_hash] = image_path
+
+        if os.path.exists(image_path):
+            self.skipped += 1
+        else:
+            self._pending.acquire()
+            future = self._executor.submit(self._write, image_path, base_image["image"])
+            future.add_done_callback(lambda _: self._pending.release())
+            self._futures.append(future)
+            self.written += 1
+        return image_path
+
+    def _write(self, image_path: str, data: bytes):
+        # 先写临时文件再替换，避免并发写同一图片时读到半个文件
+        tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, image_path)
+
+    def close(self):
+        """等待所有写盘任务完成"""
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+        logger.info(f"图片存储完成: 写入 {self.written} 张, 已存在跳过 {self.skipped} 张, "
+                    f"去重后共 {len(self._hash_paths)} 张")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
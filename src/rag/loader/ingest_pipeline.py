@@ -0,0 +1,501 @@
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src import constant
+from src.config import tracing
+from src.rag.loader.content_hash import file_hash
+from src.rag.retriever.index_manifest import IndexManifest
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+
+class IndexSink:
+    """索引写入端
+
+    embeddings 不为空时，流水线会预先用该模型计算向量并随分块一起传入 write。
+    full_rebuild 为 True 的写入端接收全部分块（而不只是新增分块），在 close 时整体重建。
+    """
+    name: str = "sink"
+    embeddings: Embeddings | None = None
+    full_rebuild: bool = False
+
+    def write(self, docs: list[Document], vectors: list[list[float]] | None):
+        raise NotImplementedError
+
+    def delete(self, ids: list[str]):
+        pass
+
+    def close(self):
+        pass
+
+
+class ChromaSink(IndexSink):
+    name = "chroma"
+
+    def __init__(self):
+        import src.rag.retriever.chroma_handler as chroma_handler
+
+        self.store = chroma_handler.chroma_store
+        self.embeddings = chroma_handler.embedding_model
+
+    def write(self, docs, vectors):
+        from src.rag.retriever.hybrid_retriever import HybridRetriever
+
+        # langchain_chroma 没有写入预计算向量的公开接口，直接 upsert 到底层集合
+        self.store._collection.upsert(
+            ids=[doc.metadata["chunk_id"] for doc in docs],
+            embeddings=vectors,
+            metadatas=[HybridRetriever.clean_metadata(doc.metadata) for doc in docs],
+            documents=[doc.page_content for doc in docs],
+        )
+
+    def delete(self, ids):
+        self.store.delete(ids=ids)
+
+
+class EsSink(IndexSink):
+    name = "es"
+
+    def __init__(self):
+        import src.rag.retriever.es_handler as es_handler
+
+        self.store = es_handler.es_store
+
+    def write(self, docs, vectors):
+        from src.rag.retriever.hybrid_retriever import HybridRetriever
+
+        self.store.add_texts(
+            texts=[doc.page_content for doc in docs],
+            metadatas=[HybridRetriever.clean_metadata(doc.metadata) for doc in docs],
+            ids=[doc.metadata["chunk_id"] for doc in docs],
+        )
+
+    def delete(self, ids):
+        self.store.delete(ids=ids)
+
+
+class _VectorBuffer:
+    """float32 向量暂存在临时的内存映射文件中，容量不足时按倍数扩容"""
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._path: str | None = None
+        self._initial_capacity = initial_capacity
+        self._matrix: np.memmap | None = None
+        self.size = 0
+
+    def append(self, vectors: list[list[float]]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        required = self.size + len(vectors)
+        if self._path is None:
+            fd, self._path = tempfile.mkstemp(prefix="faiss_sink_", suffix=".f32")
+            os.close(fd)
+        if self._matrix is None or required > len(self._matrix):
+            capacity = max(self._initial_capacity, required, 2 * (0 if self._matrix is None else len(self._matrix)))
+            if self._matrix is not None:
+                self._matrix.flush()
+                del self._matrix
+            with open(self._path, "ab") as f:
+                f.truncate(capacity * vectors.shape[1] * 4)
+            self._matrix = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, vectors.shape[1]))
+        self._matrix[self.size:required] = vectors
+        self.size = required
+
+    def array(self) -> np.ndarray:
+        return self._matrix[:self.size] if self._matrix is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def close(self):
+        self._matrix = None
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+
+
+class FaissSink(IndexSink):
+    """FAISS 写入端
+
+    flat 索引逐批原地写入磁盘上已有（或新建）的索引；IVF、HNSW 及索引类型变化时需要整体重建，
+    新增向量先暂存到内存映射文件，close 时与保留的向量一起重建。
+    磁盘上的索引由其他嵌入模型构建时不合并，只用本次写入的向量重建（ingest 会为此强制全量写入）。
+    """
+    name = "faiss"
+
+    def __init__(self):
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        self.embeddings = faiss_handler.get_embed_model()
+        self._exists = os.path.exists(os.path.join(constant.faiss_store_path, "index.faiss"))
+        self._rebuild = self._exists and not faiss_handler.embedding_matches()
+        self._store = faiss_handler.load_existing_vectorstore() if self._exists and not self._rebuild else None
+        self._in_place = constant.faiss_index_type == "flat" and (
+            self._store is None or faiss_handler.index_type_of(self._store.index) == "flat")
+        self._changed = False
+
+        # 整体重建时暂存的新增分块
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._ids: list[str] = []
+        self._vectors = _VectorBuffer()
+        self._stale_ids: list[str] = []
+
+    def write(self, docs, vectors):
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        ids = [doc.metadata["chunk_id"] for doc in docs]
+        if not self._in_place:
+            self._texts.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._ids.extend(ids)
+            self._vectors.append(vectors)
+            return
+
+        if self._store is None:
+            if self._rebuild:
+                logger.info(f"FAISS 索引的嵌入模型与 {constant.faiss_embed_model} 不一致，丢弃旧向量重建")
+            self._store = faiss_handler.create_vectorstore(list(zip(texts, vectors)), self.embeddings,
+                                                           metadatas, ids, "flat")
+        else:
+            self._store = faiss_handler.merge_vectorstore(self._store, list(zip(texts, vectors)), metadatas, ids,
+                                                          [], "flat")
+        self._changed = True
+
+    def delete(self, ids):
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        if not self._in_place:
+            self._stale_ids.extend(ids)
+        elif self._store is not None:
+            self._store = faiss_handler.merge_vectorstore(self._store, [], [], [], ids, "flat")
+            self._changed = True
+
+    def close(self):
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        try:
+            if self._in_place:
+                store = self._store if self._changed else None
+            else:
+                store = self._rebuild_store()
+            if store is not None:
+                faiss_handler.save_store(store)
+        finally:
+            self._vectors.close()
+
+    def _rebuild_store(self):
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        # 暂存的向量以内存映射的行传入，重建时才拷贝为一个连续矩阵
+        text_embeddings = list(zip(self._texts, self._vectors.array()))
+        if self._store is not None:
+            if not text_embeddings and not self._stale_ids:
+                return None
+            return faiss_handler.merge_vectorstore(self._store, text_embeddings, self._metadatas, self._ids,
+                                                   self._stale_ids)
+        if not text_embeddings:
+            return None
+        if self._rebuild:
+            logger.info(f"FAISS 索引的嵌入模型与 {constant.faiss_embed_model} 不一致，丢弃旧向量重建")
+        return faiss_handler.create_vectorstore(text_embeddings, self.embeddings, self._metadatas, self._ids)
+
+
+class Bm25Sink(IndexSink):
+    """BM25 统计量依赖全部语料，逐批累积倒排统计（超出阈值的部分落盘），close 时整体生成索引"""
+    name = "bm25"
+    full_rebuild = True
+
+    def __init__(self):
+        from src.rag.retriever.bm25_index import BM25IndexBuilder, build_tokenizer
+
+        self.builder = BM25IndexBuilder(constant.bm25_store_path, build_tokenizer({"name": constant.bm25_tokenizer}))
+
+    def write(self, docs, vectors):
+        self.builder.add(docs)
+
+    def close(self):
+        self.builder.finish()
+
+
+class MongoSink(IndexSink):
+    name = "mongo"
+
+    def __init__(self):
+        from src.config.mongodb_bulk_writer import MongoBulkWriter
+
+        self.text_writer = MongoBulkWriter("manual_text", batch_size=constant.mongo_batch_size)
+        self.image_writer = MongoBulkWriter("manual_images", key_fields=("page", "image_path"),
+                                            batch_size=constant.mongo_batch_size)
+        self._seen_images = set()
+
+    def write(self, docs, vectors):
+        from src.base_model.manual_info_mongo import ManualInfo
+
+        for doc in docs:
+            images_info = doc.metadata.get("images_info")
+            self.text_writer.add(ManualInfo(
+                unique_id=doc.metadata["chunk_id"],
+                page=doc.metadata["page"],
+                related_content=doc.page_content,
+                images_info=images_info
+            ))
+            for image in images_info or []:
+                if (image.page, image.image_path) not in self._seen_images:
+                    self._seen_images.add((image.page, image.image_path))
+                    self.image_writer.add(image)
+
+    def delete(self, ids):
+        import src.rag.loader.pdf_parse as pdf_parse
+
+        pdf_parse.delete_from_mongo(ids)
+
+    def close(self):
+        self.text_writer.close()
+        self.image_writer.close()
+
+
+SINK_FACTORIES = {
+    "chroma": ChromaSink,
+    "es": EsSink,
+    "faiss": FaissSink,
+    "bm25": Bm25Sink,
+    "mongo": MongoSink,
+}
+
+
+def build_sinks(names: list[str]) -> list[IndexSink]:
+    unknown = [name for name in names if name not in SINK_FACTORIES]
+    if unknown:
+        raise ValueError(f"Unknown index sinks: {unknown}")
+    return [SINK_FACTORIES[name]() for name in names]
+
+
+class _StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+
+class IngestPipeline:
+    """流式建索引：解析 -> 切分 -> 向量化 -> 写入
+
+    各阶段运行在独立线程中，通过有界队列相连，下游变慢时上游自动阻塞（背压），
+    各阶段之间在途的数据量只与队列容量有关。每个写入端有独立的队列和线程。
+    FaissSink 的 flat 索引逐批写入，需要重建的索引类型将向量暂存到磁盘；Bm25Sink 的倒排表分段落盘，
+    close 时合并，除索引本身与 FAISS 文档库外，处理过程中的内存不随分块数增长。
+    新增分块与过期分块由 IndexManifest 判定，只对新增分块做向量化和写入。
+    """
+
+    def __init__(self, sinks: list[IndexSink], manifest: IndexManifest, page_batch_size: int = 16,
+                 queue_size: int = 4, reindex: bool = False):
+        for sink in sinks:
+            if sink.full_rebuild and sink.embeddings is not None:
+                raise ValueError(f"Full rebuild sink {sink.name} must not require embeddings")
+
+        self.sinks = sinks
+        self.manifest = manifest
+        self.page_batch_size = page_batch_size
+        self.queue_size = queue_size
+
+        self._stop = threading.Event()
+        self._errors: list[BaseException] = []
+        self._stats: dict[str, _StageStats] = {}
+
+        # 所有分块 chunk_id -> 页码
+        self._chunks: dict[str, int] = {}
+        # 强制重建或存储组合变化时，已有分块也需要重新写入
+        same_sinks = sorted(manifest.sinks or []) == sorted(sink.name for sink in sinks)
+        self._indexed = manifest.chunks if same_sinks and not reindex else {}
+
+    # ===== 队列工具 =====
+
+    def _put(self, q: queue.Queue, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _start(self, name: str, target, *args) -> threading.Thread:
+        stats = self._stats.setdefault(name, _StageStats(name))
+
+        def run():
+            try:
+                target(stats, *args)
+            except BaseException as e:
+                logger.exception(f"ingest stage {name} failed")
+                self._errors.append(e)
+                self._stop.set()
+
+        thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    # ===== 各阶段 =====
+
+    def _parse(self, stats: _StageStats, out_q: queue.Queue):
+        # PDF 解析与语义切分依赖较重，只在真正需要建索引时导入
+        import src.rag.loader.pdf_parse as pdf_parse
+
+        batch = []
+        start = time.perf_counter()
+        for page_doc in pdf_parse.iter_pdf_pages():
+            batch.append(page_doc)
+            if len(batch) >= self.page_batch_size:
+                elapsed = time.perf_counter() - start
+                tracing.record("ingest_load_pdf", elapsed)
+                stats.busy += elapsed
+                stats.items += len(batch)
+                self._put(out_q, batch)
+                batch = []
+                start = time.perf_counter()
+            if self._stop.is_set():
+                return
+        elapsed = time.perf_counter() - start
+        if batch:
+            tracing.record("ingest_load_pdf", elapsed)
+            stats.items += len(batch)
+            self._put(out_q, batch)
+        stats.busy += elapsed
+        self._put(out_q, _DONE)
+
+    def _split(self, stats: _StageStats, in_q: queue.Queue, out_q: queue.Queue):
+        import src.rag.loader.pdf_parse as pdf_parse
+
+        while (pages := self._get(in_q)) is not _DONE:
+            start = time.perf_counter()
+            with tracing.span("ingest_split"):
+                split_docs = pdf_parse.split_pages(pages)
+
+            all_docs, new_docs = [], []
+            for doc in split_docs:
+                chunk_id = doc.metadata["chunk_id"]
+                if chunk_id in self._chunks:
+                    continue
+                self._chunks[chunk_id] = doc.metadata["page"]
+                all_docs.append(doc)
+                if chunk_id not in self._indexed:
+                    new_docs.append(doc)
+
+            stats.busy += time.perf_counter() - start
+            stats.items += len(split_docs)
+            self._put(out_q, (all_docs, new_docs))
+        self._put(out_q, _DONE)
+
+    def _embed(self, stats: _StageStats, in_q: queue.Queue, sink_queues: list[queue.Queue]):
+        # 相同模型的写入端共享一次向量化
+        models = {id(sink.embeddings): sink.embeddings for sink in self.sinks if sink.embeddings is not None}
+
+        while (item := self._get(in_q)) is not _DONE:
+            all_docs, new_docs = item
+            start = time.perf_counter()
+            texts = [doc.page_content for doc in new_docs]
+            with tracing.span("ingest_embed"):
+                vectors = {key: model.embed_documents(texts) for key, model in models.items()} if texts else {}
+            stats.busy += time.perf_counter() - start
+            stats.items += len(new_docs)
+
+            for sink, sink_q in zip(self.sinks, sink_queues):
+                docs = all_docs if sink.full_rebuild else new_docs
+                if docs:
+                    sink_vectors = vectors.get(id(sink.embeddings)) if sink.embeddings is not None else None
+                    self._put(sink_q, (docs, sink_vectors))
+
+        for sink_q in sink_queues:
+            self._put(sink_q, _DONE)
+
+    def _write(self, stats: _StageStats, sink: IndexSink, in_q: queue.Queue):
+        while (item := self._get(in_q)) is not _DONE:
+            docs, vectors = item
+            start = time.perf_counter()
+            with tracing.span("ingest_write", sink=sink.name):
+                sink.write(docs, vectors)
+            stats.busy += time.perf_counter() - start
+            stats.items += len(docs)
+
+    # ===== 入口 =====
+
+    def run(self, source_hash: str):
+        start = time.perf_counter()
+
+        pages_q = queue.Queue(maxsize=self.queue_size)
+        chunks_q = queue.Queue(maxsize=self.queue_size)
+        sink_queues = [queue.Queue(maxsize=self.queue_size) for _ in self.sinks]
+
+        threads = [
+            self._start("parse", self._parse, pages_q),
+            self._start("split", self._split, pages_q, chunks_q),
+            self._start("embed", self._embed, chunks_q, sink_queues),
+        ]
+        threads += [self._start(f"sink-{sink.name}", self._write, sink, sink_q)
+                    for sink, sink_q in zip(self.sinks, sink_queues)]
+
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise RuntimeError("Ingest pipeline failed") from self._errors[0]
+
+        # 删除本次未出现的过期分块，全部写入成功后再更新清单
+        stale_ids = [chunk_id for chunk_id in self.manifest.chunks if chunk_id not in self._chunks]
+        for sink in self.sinks:
+            with tracing.span("ingest_close", sink=sink.name):
+                if stale_ids and not sink.full_rebuild:
+                    sink.delete(stale_ids)
+                sink.close()
+
+        self.manifest.replace(source_hash, self._chunks, [sink.name for sink in self.sinks])
+        self.manifest.save()
+
+        wall = time.perf_counter() - start
+        for stats in self._stats.values():
+            logger.info(f"[ingest] {stats.name}: {stats.items} 项, 忙碌 {stats.busy:.2f}s")
+        logger.info(f"[ingest] 共 {len(self._chunks)} 个分块, 删除 {len(stale_ids)} 个过期分块, 总耗时 {wall:.2f}s")
+
+
+def ingest(sink_names: list[str] = None, force: bool = False) -> bool:
+    """增量建索引，PDF 与存储组合均未变化时直接返回 False
+
+    Args:
+        force: 忽略清单，重新解析并写入全部分块
+    """
+    sink_names = sink_names or constant.ingest_sinks
+    manifest = IndexManifest.load(constant.index_manifest_path)
+    source_hash = file_hash(constant.pdf_path)
+
+    if "faiss" in sink_names and not force:
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        # 嵌入模型变化后旧向量不可用，FAISS 需要全部分块重新向量化
+        if not faiss_handler.embedding_matches():
+            logger.info(f"FAISS 嵌入模型变为 {constant.faiss_embed_model}，重新写入全部分块")
+            force = True
+
+    if not force and manifest.is_up_to_date(source_hash, sink_names):
+        logger.info("PDF 未变化，跳过索引构建")
+        return False
+
+    IngestPipeline(build_sinks(sink_names), manifest, reindex=force).run(source_hash)
+    return True
@@ -0,0 +1,54 @@
+import math
+
+import fitz
+
+# 空间索引的水平条带高度（pt）
+BAND_HEIGHT = 50
+
+
+class PageLayout:
+    """单页版面模型，页面文本只解析一次，供页内所有图片复用
+
+    - blocks: page.get_text("blocks") 的结果，顺序与原始输出一致
+    - 首个 span 的字号/粗体信息来自 page.get_text("dict")，按需解析一次
+    - 按 y 方向条带建立的空间索引，用于快速查找与区域相交的文本块
+    """
+
+    def __init__(self, page: fitz.Page):
+        self.page = page
+        self.blocks = page.get_text("blocks")
+        self.rects = [fitz.Rect(block[:4]) for block in self.blocks]
+
+        self._dict_blocks = None
+        self._first_spans: dict[int, tuple[float, bool] | None] = {}
+
+        self._bands: dict[int, list[int]] = {}
+        for index, rect in enumerate(self.rects):
+            for band in self._band_range(rect):
+                self._bands.setdefault(band, []).append(index)
+
+    @staticmethod
+    def _band_range(rect: fitz.Rect) -> range:
+        if rect.y1 < rect.y0:
+            return range(0)
+        return range(math.floor(rect.y0 / BAND_HEIGHT), math.floor(rect.y1 / BAND_HEIGHT) + 1)
+
+    def intersecting_blocks(self, rect: fitz.Rect) -> list[int]:
+        """返回与 rect 相交的文本块下标，保持原始块顺序"""
+        candidates = set()
+        for band in self._band_range(rect):
+            candidates.update(self._bands.get(band, ()))
+        return [index for index in sorted(candidates) if self.rects[index].intersects(rect)]
+
+    def first_span(self, block: tuple) -> tuple[float, bool] | None:
+        """返回文本块首个 span 的 (字号, 是否粗体)，不存在时返回 None"""
+        block_no = block[5]
+        if block_no not in self._first_spans:
+            if self._dict_blocks is None:
+                self._dict_blocks = self.page.get_text("dict")["blocks"]
+            try:
+                span = self._dict_blocks[block_no]["lines"][0]["spans"][0]
+                self._first_spans[block_no] = (span["size"], "bold" in span["font"].lower())
+            except (IndexError, KeyError):
+                self._first_spans[block_no] = None
+        return self._first_spans[block_no]
@@ -0,0 +1,73 @@
+import fitz
+from langchain_core.documents import Document
+from typing_extensions import Iterator, List
+
+from src import constant
+from src.base_model.manual_images import ManualImages
+import src.rag.loader.image_handler as image_handler
+from src.rag.loader.content_hash import stable_hash
+from src.rag.loader.image_store import ImageStore
+from src.rag.loader.page_layout import PageLayout
+
+file_path = constant.pdf_path
+
+
+def parse_page(page: fitz.Page, image_store: ImageStore) -> Document | None:
+    """解析单页的文本与图片信息"""
+    text = page.get_text()
+    images = page.get_images(full=True)
+
+    # 版面只在页面含图片时解析一次，页内所有图片共享
+    layout = PageLayout(page) if images else None
+
+    manual_images_list: List[ManualImages] = []
+    for img in images:
+        manual_image: ManualImages = image_handler.handle_image(img, page, image_store, layout)
+        if manual_image:
+            manual_images_list.append(manual_image)
+
+    if not text.strip():
+        return None
+
+    unique_id = f"{stable_hash(text)}_{page.number + 1}"
+    metadata = {
+        "unique_id": unique_id,
+        "source": file_path,
+        "page": page.number + 1,
+        "images_info": manual_images_list
+    }
+    return Document(page_content=text, metadata=metadata)
+
+
+def load_page_range(start: int, end: int) -> list[Document]:
+    """解析 [start, end) 范围内的页面
+
+    作为进程池的工作函数，每个工作进程独立打开自己的 fitz 文档，
+    本模块只依赖 fitz 与 image_handler，避免子进程加载模型。
+    """
+    return list(iter_page_range(start, end))
+
+
+def iter_page_range(start: int, end: int) -> Iterator[Document]:
+    """逐页解析 [start, end) 范围内的页面"""
+    with fitz.open(file_path) as pdf, ImageStore() as image_store:
+        for page_num in range(start, end):
+            doc = parse_page(pdf.load_page(page_num), image_store)
+            if doc:
+                yield doc
+
+
+def split_page_ranges(page_count: int, workers: int, ranges_per_worker: int = 4) -> list[tuple[int, int]]:
+    """将页码切分为连续区间，区间数量多于进程数以平衡负载"""
+    if page_count <= 0:
+        return []
+    n_ranges = min(page_count, max(1, workers * ranges_per_worker))
+    step, remainder = divmod(page_count, n_ranges)
+
+    ranges = []
+    start = 0
+    for i in range(n_ranges):
+        end = start + step + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
@@ -1,32 +1,30 @@
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import fitz
-import tiktoken
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pymongo.collection import Collection
-from typing_extensions import List
+from typing_extensions import Iterator
 
 import src.rag.llm.m3e_small_model as m3e_small_model
 from src import constant
-from src.base_model.manual_images import ManualImages
-from src.base_model.manual_info_mongo import ManualInfo
 from src.config.mongodb_config import MongoConfig
-import src.rag.loader.image_handler as image_handler
+from src.config.resource_registry import LazyResource, lazy_module_attrs
+import src.rag.loader.page_loader as page_loader
+from src.rag.loader.content_hash import stable_hash
+from src.rag.loader.token_splitter import TokenOffsetTextSplitter
 
 # 公共配置区
-encoding = tiktoken.get_encoding("cl100k_base")
-manual_text_collection: Collection = MongoConfig.get_collection("manual_text")
+_manual_text_collection = LazyResource("manual_text_collection", lambda: MongoConfig.get_collection("manual_text"))
 file_path = constant.pdf_path
 
 # ===== TextSplitter 设置 =====
 
-text_splitter = RecursiveCharacterTextSplitter(
+# 每个片段只编码一次，切分结果与 RecursiveCharacterTextSplitter(separators=["\n\n"]) 一致
+text_splitter = TokenOffsetTextSplitter(
     chunk_size=512,
     chunk_overlap=126,
-    # 按这个优先级递归切
-    separators=["\n\n"],
-    length_function=lambda text: len(encoding.encode(text))
+    separator="\n\n"
 )
 
 
@@ -38,77 +36,95 @@ def sentence_split(text: str) -> list[str]:
     return [s.strip() for s in sentences if s.strip()]
 
 
-def load_pdf() -> list[Document]:
-    pdf = fitz.open(file_path)
-    raw_docs = []
+def load_pdf(workers: int = None) -> list[Document]:
+    """解析 PDF 的全部页面
 
-    for page_num in range(len(pdf)):
-        page = pdf.load_page(page_num)
-        text = page.get_text()
-        images = page.get_images(full=True)
+    Args:
+        workers: 解析进程数，默认读取 constant.pdf_parse_workers；
+            大于 1 时按页码区间分发到进程池，输出顺序与单进程一致
+    """
+    return list(iter_pdf_pages(workers))
 
-        manual_images_list: List[ManualImages] = []
-        for img_index, img in enumerate(images):
-            manual_image: ManualImages = image_handler.handle_image(img, img_index, page)
-            if manual_image:
-                manual_images_list.append(manual_image)
 
-        if text.strip():
-            unique_id = f"{hash(text)}_{page}"
-            metadata = {
-                "unique_id": unique_id,
-                "source": file_path,
-                "page": page_num + 1,
-                "images_info": manual_images_list
-            }
+def iter_pdf_pages(workers: int = None) -> Iterator[Document]:
+    """按页序逐页产出解析结果，多进程时同时在途的页码区间数量有上限"""
+    workers = workers or constant.pdf_parse_workers
 
-            raw_docs.append(Document(page_content=text, metadata=metadata))
+    if workers <= 1:
+        yield from page_loader.iter_page_range(0, _page_count())
+        return
 
-    return raw_docs
+    page_ranges = deque(page_loader.split_page_ranges(_page_count(), workers))
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        while page_ranges or in_flight:
+            while page_ranges and len(in_flight) < max_in_flight:
+                in_flight.append(executor.submit(page_loader.load_page_range, *page_ranges.popleft()))
+            # 按提交顺序取结果，保证页序确定
+            yield from in_flight.popleft().result()
 
 
-def load_and_split() -> list[Document]:
-    """加载 PDF 文档，进行句子级 + 语义感知切分"""
-    raw_docs: list[Document] = load_pdf()
-    all_split_docs = []
+def _page_count() -> int:
+    with fitz.open(file_path) as pdf:
+        return len(pdf)
 
-    for doc in raw_docs:
-        sentences = [doc.page_content]
 
-        grouped_chunks = m3e_small_model.semantic_group(sentences, group_size=5)
+def load_and_split(method: str = None) -> list[Document]:
+    """加载 PDF 文档，进行句子级 + 语义感知切分
 
+    Args:
+        method: 语义切分方式，默认读取 constant.semantic_chunk_method
+    """
+    return split_pages(load_pdf(), method)
+
+
+def split_pages(raw_docs: list[Document], method: str = None) -> list[Document]:
+    """对一批页面进行语义分组与 token 切分，同一页的分块必须在同一批内"""
+    grouped_docs = semantic_split(raw_docs, method or constant.semantic_chunk_method)
+
+    chunks, metadatas = [], []
+    for doc, grouped_chunks in zip(raw_docs, grouped_docs):
         for chunk in grouped_chunks:
-            # 以 chunk 为单位继续用 langchain 切分（带 overlap）
-            split_docs = text_splitter.create_documents([chunk], metadatas=[doc.metadata])
+            chunks.append(chunk)
+            metadatas.append(doc.metadata)
 
-            # save_2_mongo(split_docs)
-            all_split_docs.extend(split_docs)
+    # 以 chunk 为单位按 token 切分（带 overlap），整批页面批量编码
+    all_split_docs = text_splitter.create_documents(chunks, metadatas=metadatas)
 
+    assign_chunk_ids(all_split_docs)
     return all_split_docs
 
 
-def save_2_mongo(split_docs):
+def semantic_split(raw_docs: list[Document], method: str) -> list[list[str]]:
+    """将每页文本切句后按语义分组，返回与 raw_docs 一一对应的分组文本"""
+    if method == "page":
+        return [[doc.page_content] for doc in raw_docs]
+
+    documents = [sentence_split(doc.page_content) for doc in raw_docs]
+    if method == "breakpoint":
+        return m3e_small_model.semantic_chunk(documents)
+    if method == "cluster":
+        return [m3e_small_model.semantic_group(sentences, group_size=5) for sentences in documents]
+    raise ValueError(f"Unknown semantic chunk method: {method}")
+
+
+def assign_chunk_ids(split_docs: list[Document]):
+    """为分块生成基于内容的稳定 chunk_id，并记录其在页内的序号"""
+    page_chunk_counts = {}
     for doc in split_docs:
-        # 从 metadata 中提取关键参数
-        metadata = doc.metadata
-        page = metadata.get("page")
-
-        # 构造唯一性 unique_id
-        unique_id = metadata.get("unique_id")
-        # 处理 images_info 字段
-        images_info = metadata.get("images_info")
-
-        # 创建文档记录对象
-        doc_record = ManualInfo(
-            unique_id=unique_id,
-            page=page,
-            related_content=doc.page_content,
-            images_info=images_info
-        )
-
-        # 更新数据库操作
-        manual_text_collection.update_one(
-            {"unique_id": doc_record.unique_id},
-            {"$set": doc_record.model_dump()},
-            upsert=True
-        )
+        page = doc.metadata["page"]
+        chunk_index = page_chunk_counts.get(page, 0)
+        page_chunk_counts[page] = chunk_index + 1
+
+        doc.metadata["chunk_index"] = chunk_index
+        doc.metadata["chunk_id"] = f"{stable_hash(f'{page}:{doc.page_content}')}_{page}"
+
+
+def delete_from_mongo(unique_ids: list[str]):
+    if not unique_ids:
+        return
+    _manual_text_collection.get().delete_many({"unique_id": {"$in": unique_ids}})
+
+
+__getattr__ = lazy_module_attrs(__name__, {"manual_text_collection": _manual_text_collection})
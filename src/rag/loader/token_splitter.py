@@ -0,0 +1,167 @@
+import copy
+import logging
+import re
+import time
+from functools import cached_property
+
+import tiktoken
+from langchain_core.documents import Document
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class TokenOffsetTextSplitter:
+    """基于 token 偏移的文本切分器
+
+    与 RecursiveCharacterTextSplitter(separators=[separator], keep_separator=True,
+    length_function=tiktoken 长度) 的切分结果一致，但每个片段只编码一次：
+    先按分隔符把所有输入切成片段并批量编码，再在片段的 token 累计偏移上直接合并出分块。
+    """
+
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 126, separator: str = "\n\n",
+                 encoding_name: str = "cl100k_base"):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must not exceed chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separator = separator
+        self.encoding_name = encoding_name
+        self._separator_pattern = f"({re.escape(separator)})"
+
+    @cached_property
+    def encoding(self) -> tiktoken.Encoding:
+        # 首次切分时才加载词表
+        return tiktoken.get_encoding(self.encoding_name)
+
+    def _split_pieces(self, text: str) -> list[str]:
+        """按分隔符切分，分隔符保留在后一个片段开头"""
+        splits = re.split(self._separator_pattern, text)
+        pieces = [splits[0]] + [splits[i] + splits[i + 1] for i in range(1, len(splits), 2)]
+        return [piece for piece in pieces if piece != ""]
+
+    def _merge(self, pieces: list[str], lengths: list[int], lo: int, hi: int) -> list[str]:
+        """在 token 累计偏移上合并 pieces[lo:hi]，语义与 langchain 的 _merge_splits 一致"""
+        offsets = [0]
+        for length in lengths[lo:hi]:
+            offsets.append(offsets[-1] + length)
+
+        def total(start: int, end: int) -> int:
+            return offsets[end - lo] - offsets[start - lo]
+
+        ranges = []
+        start = lo
+        for end in range(lo, hi):
+            piece_len = lengths[end]
+            if total(start, end) + piece_len > self.chunk_size:
+                if total(start, end) > self.chunk_size:
+                    logger.warning(f"Created a chunk of size {total(start, end)}, "
+                                   f"which is longer than the specified {self.chunk_size}")
+                if end > start:
+                    ranges.append((start, end))
+                    # 保留不超过 chunk_overlap 的尾部作为下一个分块的开头
+                    while total(start, end) > self.chunk_overlap or (
+                            total(start, end) + piece_len > self.chunk_size and total(start, end) > 0):
+                        start += 1
+        ranges.append((start, hi))
+
+        chunks = []
+        for start, end in ranges:
+            chunk = "".join(pieces[start:end]).strip()
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def split_texts(self, texts: list[str]) -> list[list[str]]:
+        """批量切分，所有文本的片段一次性批量编码"""
+        text_pieces = [self._split_pieces(text) for text in texts]
+        flat_pieces = [piece for pieces in text_pieces for piece in pieces]
+        flat_lengths = [len(tokens) for tokens in self.encoding.encode_batch(flat_pieces)]
+
+        results = []
+        cursor = 0
+        for pieces in text_pieces:
+            lengths = flat_lengths[cursor:cursor + len(pieces)]
+            cursor += len(pieces)
+
+            chunks = []
+            good_start = None
+            for i, length in enumerate(lengths):
+                if length < self.chunk_size:
+                    if good_start is None:
+                        good_start = i
+                    continue
+                if good_start is not None:
+                    chunks.extend(self._merge(pieces, lengths, good_start, i))
+                    good_start = None
+                # 超长片段无法继续切分，原样保留
+                chunks.append(pieces[i])
+            if good_start is not None:
+                chunks.extend(self._merge(pieces, lengths, good_start, len(pieces)))
+            results.append(chunks)
+        return results
+
+    def split_text(self, text: str) -> list[str]:
+        return self.split_texts([text])[0]
+
+    def create_documents(self, texts: list[str], metadatas: list[dict] = None) -> list[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for chunks, metadata in zip(self.split_texts(texts), metadatas):
+            for chunk in chunks:
+                documents.append(Document(page_content=chunk, metadata=copy.deepcopy(metadata)))
+        return documents
+
+
+def reference_splitter(splitter: TokenOffsetTextSplitter):
+    """构造与 splitter 参数相同的 langchain 切分器，用于校验与对比"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=splitter.chunk_size,
+        chunk_overlap=splitter.chunk_overlap,
+        separators=[splitter.separator],
+        length_function=lambda text: len(splitter.encoding.encode(text))
+    )
+
+
+def validate_against_reference(texts: list[str], splitter: TokenOffsetTextSplitter = None) -> list[int]:
+    """逐条对比与 langchain 切分器的结果，返回不一致的文本下标"""
+    splitter = splitter or TokenOffsetTextSplitter()
+    reference = reference_splitter(splitter)
+    return [i for i, (text, chunks) in enumerate(zip(texts, splitter.split_texts(texts)))
+            if reference.split_text(text) != chunks]
+
+
+def benchmark(pdf_path: str, repeat: int = 3):
+    """对比 pdf 全部页面在两种切分器下的耗时，并校验切分边界"""
+    import fitz
+
+    with fitz.open(pdf_path) as pdf:
+        texts = [page.get_text() for page in pdf]
+
+    splitter = TokenOffsetTextSplitter()
+    reference = reference_splitter(splitter)
+
+    def best_of(fn) -> float:
+        costs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            costs.append(time.perf_counter() - start)
+        return min(costs)
+
+    reference_cost = best_of(lambda: [reference.split_text(text) for text in texts])
+    token_cost = best_of(lambda: splitter.split_texts(texts))
+    mismatches = validate_against_reference(texts, splitter)
+
+    logger.info(f"{len(texts)} 页: langchain {reference_cost:.3f}s, token 偏移 {token_cost:.3f}s, "
+                f"加速 {reference_cost / token_cost:.1f}x, 边界不一致 {len(mismatches)} 页")
+    return reference_cost, token_cost, mismatches
+
+
+if __name__ == '__main__':
+    from src import constant
+
+    benchmark(constant.pdf_path)
@@ -4,9 +4,12 @@ from pydantic import BaseModel, Field
 
 from src.base_model.manual_images import ManualImages
 
-split_theme_prompt_template = """
+# 提示词的特征文本，LLM 缓存据此划分命名空间
+split_theme_marker = "以下是几段从知识库中检索出的文档"
+
+split_theme_prompt_template = f"""
 ==== 任务说明 ====
-以下是几段从知识库中检索出的文档，它们可能来自不同的来源，内容可能存在重复、冗余或逻辑混乱的问题。你的任务是：\n"
+{split_theme_marker}，它们可能来自不同的来源，内容可能存在重复、冗余或逻辑混乱的问题。你的任务是：\n"
 "1. 对这些文档的内容进行整合和归纳，总结出清晰的主题。\n"
 "2. 根据主题提炼出文档的关键内容，并去掉重复的信息，对于内容相似的文档可以进行取舍与合并。\n"
 "3. 将文档重新组织为多条逻辑清晰的文章，条理分明，语言简洁。\n"
@@ -18,7 +21,7 @@ split_theme_prompt_template = """
 * 如无有效内容，返回空
 
 ==== 以下是需要整理的文档 ===
-{context}
+{{context}}
 """
 
 
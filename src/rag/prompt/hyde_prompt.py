@@ -1,7 +1,10 @@
-hyde_prompt = """
-请根据以下问题生成一个初步答案。这个答案不需要非常详细，但需要尽可能与问题相关，提供一个简要的方向性回答。
+# 提示词的特征文本，LLM 缓存据此划分命名空间
+hyde_marker = "请根据以下问题生成一个初步答案"
+
+hyde_prompt = f"""
+{hyde_marker}。这个答案不需要非常详细，但需要尽可能与问题相关，提供一个简要的方向性回答。
 ===问题===
-{question}
+{{question}}
 
 ===任务===
 1. 你的回答应尽量基于常识或通用知识。
@@ -4,6 +4,10 @@ from pathlib import Path
 
 from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from src import constant
+from src.rag.retriever.bm25_index import BM25Index, build_tokenizer
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
@@ -36,7 +40,7 @@ def save_bm25(split_docs: list[Document], k=5, save_path: str = "bm25_index"):
         "texts": retriever.docs,
         "meta_datas": [doc.metadata for doc in retriever.docs],
         # 核心BM25模型参数
-        "bm25_model": retriever.bm25
+        "bm25_model": retriever.vectorizer
     }
 
     # 保存到文件
@@ -52,14 +56,40 @@ def load_bm25(load_path: str = "bm25_index") -> BM25Retriever:
     with open(f"{load_path}/bm25_data.pkl", "rb") as f:
         data = pickle.load(f)
 
-    # 重建文档对象
-    docs = [
-        Document(page_content=text, metadata=metadata)
-        for text, metadata in zip(data["texts"], data["meta_datas"])
-    ]
+    # texts 中保存的就是 Document 对象，直接复用已训练的 BM25 模型，无需重新建索引
+    return BM25Retriever(vectorizer=data["bm25_model"], docs=data["texts"])
 
-    # 重建检索器
-    retriever = BM25Retriever.from_documents(docs)
 
-    retriever.bm25 = data["bm25_model"]
-    return retriever
+class BM25Store(VectorStore):
+    """将紧凑 BM25 索引适配为只读 VectorStore，供 HybridRetriever 作为关键词通道使用"""
+
+    def __init__(self, index: BM25Index):
+        self.index = index
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("BM25 索引只读，请通过 save_bm25_index 重建")
+
+    @classmethod
+    def from_texts(cls, texts, embedding=None, metadatas=None, save_path: str = "bm25_index", **kwargs) -> "BM25Store":
+        metadatas = metadatas or [{}] * len(texts)
+        docs = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        return cls(BM25Index.build(docs, save_path))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list[tuple[Document, float]]:
+        # 与 ES 一致，不返回没有任何词项命中的文档
+        return [(self.index.get_document(doc_id), score) for doc_id, score in self.index.search(query, k)]
+
+
+def save_bm25_index(split_docs: list[Document], save_path: str = "bm25_index", tokenizer_name: str = None) -> BM25Index:
+    """构建紧凑 BM25 索引，分词器默认读取 constant.bm25_tokenizer"""
+    tokenizer = build_tokenizer({"name": tokenizer_name or constant.bm25_tokenizer})
+    index = BM25Index.build(split_docs, save_path, tokenizer)
+    logger.info(f"BM25索引已保存至 {save_path} 目录")
+    return index
+
+
+def load_bm25_store(load_path: str = "bm25_index") -> BM25Store:
+    return BM25Store(BM25Index.load(load_path))
@@ -0,0 +1,392 @@
+import hashlib
+import json
+from array import array
+from collections import Counter
+import logging
+import mmap
+import os
+import re
+import shutil
+import time
+import unicodedata
+
+import numpy as np
+from langchain_core.documents import Document
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+# 连续的中日韩字符，或连续的字母数字
+_TOKEN_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+class CharNgramTokenizer:
+    """中文按字符 n-gram 切分，英文与数字按整词保留，不依赖词典"""
+    name = "char_ngram"
+
+    def __init__(self, ngram_range: tuple[int, int] = (1, 2)):
+        self.ngram_range = tuple(ngram_range)
+
+    def __call__(self, text: str) -> list[str]:
+        tokens = []
+        low, high = self.ngram_range
+        for run in _TOKEN_RUN.findall(_normalize(text)):
+            if not _CJK.match(run):
+                tokens.append(run)
+                continue
+            for n in range(low, high + 1):
+                tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+        return tokens
+
+    def config(self) -> dict:
+        return {"name": self.name, "ngram_range": list(self.ngram_range)}
+
+
+class JiebaTokenizer:
+    """基于 jieba 词典的搜索引擎模式分词，需要安装 jieba"""
+    name = "jieba"
+
+    def __init__(self, user_dict: str = None):
+        # 可选依赖，仅在选择该分词器时需要
+        import jieba
+
+        self.user_dict = user_dict
+        self._jieba = jieba
+        if user_dict:
+            jieba.load_userdict(user_dict)
+
+    def __call__(self, text: str) -> list[str]:
+        return [token for token in self._jieba.lcut_for_search(_normalize(text)) if _TOKEN_RUN.fullmatch(token)]
+
+    def config(self) -> dict:
+        return {"name": self.name, "user_dict": self.user_dict}
+
+
+TOKENIZERS = {
+    CharNgramTokenizer.name: CharNgramTokenizer,
+    JiebaTokenizer.name: JiebaTokenizer,
+}
+
+
+def build_tokenizer(config: dict):
+    params = dict(config)
+    name = params.pop("name")
+    if name not in TOKENIZERS:
+        raise ValueError(f"Unknown BM25 tokenizer: {name}, expected one of {list(TOKENIZERS)}")
+    return TOKENIZERS[name](**params)
+
+
+def _term_hash(term: str) -> int:
+    """词项的 64 位稳定哈希，词表以排序后的哈希数组存储，加载时无需解析"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    return {key: value for key, value in (metadata or {}).items()
+            if isinstance(value, (str, int, float, bool)) or value is None}
+
+
+class BM25Index:
+    """紧凑的 BM25 倒排索引
+
+    磁盘格式（目录）：
+        meta.json         参数、文档数、平均文档长度、分词器配置
+        term_hashes.npy   排序后的词项哈希 (uint64)
+        term_offsets.npy  每个词项倒排表在 postings 中的起止偏移 (int64, V+1)
+        postings_docs.npy 倒排表中的文档下标 (int32)
+        postings_tfs.npy  倒排表中的词频 (float32)
+        idf.npy           词项 idf (float32)
+        doc_lens.npy      文档长度 (float32)
+        docs.jsonl        文档内容与元数据，每行一个
+        doc_offsets.npy   docs.jsonl 中每行的字节偏移 (int64, N+1)
+
+    所有数组以 mmap 方式加载，文档内容按需读取，加载耗时与索引大小基本无关。
+    打分时对每个查询词项的倒排表做向量化累加。
+    """
+
+    def __init__(self, path: str, meta: dict, arrays: dict[str, np.ndarray], tokenizer):
+        self.path = path
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.avgdl = meta["avgdl"]
+        self.n_docs = meta["n_docs"]
+        self.tokenizer = tokenizer
+
+        self.term_hashes = arrays["term_hashes"]
+        self.term_offsets = arrays["term_offsets"]
+        self.postings_docs = arrays["postings_docs"]
+        self.postings_tfs = arrays["postings_tfs"]
+        self.idf = arrays["idf"]
+        self.doc_lens = arrays["doc_lens"]
+        self.doc_offsets = arrays["doc_offsets"]
+
+        # BM25 分母中与词项无关的部分
+        self._doc_norms = (self.k1 * (1 - self.b + self.b * self.doc_lens / max(self.avgdl, 1e-9))).astype(np.float32)
+        self._docs_file = None
+        self._docs_mmap = None
+
+    # ===== 构建 =====
+
+    @classmethod
+    def build(cls, docs: list[Document], path: str, tokenizer=None, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        builder = BM25IndexBuilder(path, tokenizer, k1, b)
+        builder.add(docs)
+        return builder.finish()
+
+    # ===== 加载 =====
+
+    @classmethod
+    def load(cls, path: str, tokenizer=None) -> "BM25Index":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version in {path}: {meta.get('version')}")
+
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                  for name in ("term_hashes", "term_offsets", "postings_docs", "postings_tfs",
+                               "idf", "doc_lens", "doc_offsets")}
+        return cls(path, meta, arrays, tokenizer or build_tokenizer(meta["tokenizer"]))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    # ===== 查询 =====
+
+    def _term_ids(self, tokens: list[str]) -> np.ndarray:
+        if not tokens or not len(self.term_hashes):
+            return np.zeros(0, dtype=np.int64)
+        hashes = np.fromiter((_term_hash(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+        positions = np.searchsorted(self.term_hashes, hashes)
+        positions = np.minimum(positions, len(self.term_hashes) - 1)
+        return positions[self.term_hashes[positions] == hashes]
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """计算查询对所有文档的 BM25 分数，查询中重复的词项按出现次数累加"""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        term_ids, counts = np.unique(self._term_ids(self.tokenizer(query)), return_counts=True)
+        for term_id, count in zip(term_ids, counts):
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            doc_ids = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            # 同一词项的倒排表中文档不重复，可直接按下标累加
+            scores[doc_ids] += count * self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self._doc_norms[doc_ids])
+        return scores
+
+    def search(self, query: str, k: int = 5) -> list[tuple[int, float]]:
+        """返回 [(文档下标, 分数)]，按分数降序，不包含零分文档"""
+        scores = self.get_scores(query)
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def get_document(self, doc_id: int) -> Document:
+        """按需从 docs.jsonl 读取文档"""
+        if self._docs_mmap is None:
+            self._docs_file = open(os.path.join(self.path, "docs.jsonl"), "rb")
+            self._docs_mmap = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ)
+        start, end = self.doc_offsets[doc_id], self.doc_offsets[doc_id + 1]
+        record = json.loads(self._docs_mmap[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+class BM25IndexBuilder:
+    """增量构建 BM25 索引，文档逐批加入，不保留文档内容
+
+    倒排表在内存中累积到 spill_postings 条后按 (词项哈希, 文档下标) 排序写成临时数组文件，
+    finish 时合并各段；内存中只保留词表与未落盘的一段，与语料规模无关。
+    先写入临时目录，finish 时整体替换目标目录，正在 mmap 旧索引的读者不受影响。
+    """
+
+    def __init__(self, path: str, tokenizer=None, k1: float = 1.5, b: float = 0.75,
+                 spill_postings: int = 1_000_000):
+        self.path = path
+        self.tokenizer = tokenizer or CharNgramTokenizer()
+        self.k1 = k1
+        self.b = b
+        self.spill_postings = spill_postings
+
+        self._tmp_path = f"{path}.tmp"
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+        self._docs_file = open(os.path.join(self._tmp_path, "docs.jsonl"), "wb")
+
+        # 词项 -> {文档下标: 词频}，只含尚未落盘的一段
+        self._postings: dict[str, dict[int, int]] = {}
+        self._buffered = 0
+        self._runs: list[str] = []
+        # 词项哈希 -> 词项，用于发现哈希冲突
+        self._terms: dict[int, str] = {}
+        self._doc_lens = array("q")
+        self._doc_offsets = array("q", [0])
+
+    def add(self, docs: list[Document]):
+        for doc in docs:
+            doc_id = len(self._doc_lens)
+            tokens = self.tokenizer(doc.page_content)
+            self._doc_lens.append(len(tokens))
+            term_freqs = Counter(tokens)
+            for token, tf in term_freqs.items():
+                self._postings.setdefault(token, {})[doc_id] = tf
+            self._buffered += len(term_freqs)
+
+            line = json.dumps({"page_content": doc.page_content, "metadata": _clean_metadata(doc.metadata)},
+                              ensure_ascii=False).encode("utf-8") + b"\n"
+            self._docs_file.write(line)
+            self._doc_offsets.append(self._doc_offsets[-1] + len(line))
+
+            if self._buffered >= self.spill_postings:
+                self._spill()
+
+    def _spill(self):
+        """将内存中的倒排表排序后写成一段临时文件"""
+        if not self._postings:
+            return
+        hashes = {}
+        for term in self._postings:
+            term_hash = _term_hash(term)
+            if self._terms.setdefault(term_hash, term) != term:
+                raise RuntimeError("BM25 term hash collision, rebuild with a different tokenizer")
+            hashes[term] = term_hash
+        terms = sorted(self._postings, key=hashes.get)
+
+        count = sum(len(self._postings[term]) for term in terms)
+        run = {
+            "hashes": np.repeat(np.fromiter((hashes[term] for term in terms), dtype=np.uint64, count=len(terms)),
+                                [len(self._postings[term]) for term in terms]),
+            "docs": np.fromiter((doc_id for term in terms for doc_id in self._postings[term]),
+                                dtype=np.int32, count=count),
+            "tfs": np.fromiter((tf for term in terms for tf in self._postings[term].values()),
+                               dtype=np.float32, count=count),
+        }
+        run_path = os.path.join(self._tmp_path, f"run_{len(self._runs)}")
+        for name, values in run.items():
+            np.save(f"{run_path}_{name}.npy", values)
+        self._runs.append(run_path)
+        self._postings = {}
+        self._buffered = 0
+
+    def _merge_runs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """合并各段为按 (词项哈希, 文档下标) 排序的倒排数组，段内已排序且后一段的文档下标更大"""
+        def load(name: str, dtype) -> np.ndarray:
+            parts = [np.load(f"{run_path}_{name}.npy", mmap_mode="r") for run_path in self._runs]
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+        hashes = load("hashes", np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        merged = hashes[order], load("docs", np.int32)[order], load("tfs", np.float32)[order]
+        for run_path in self._runs:
+            for name in ("hashes", "docs", "tfs"):
+                os.remove(f"{run_path}_{name}.npy")
+        return merged
+
+    def finish(self) -> BM25Index:
+        self._docs_file.close()
+        self._spill()
+        hashes, postings_docs, postings_tfs = self._merge_runs()
+
+        term_hashes, counts = np.unique(hashes, return_counts=True)
+        term_offsets = np.zeros(len(term_hashes) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum(counts)
+
+        n_docs = len(self._doc_lens)
+        doc_freqs = np.diff(term_offsets).astype(np.float32)
+        # 非负 idf（Lucene 形式），避免高频词得到负分
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        doc_lens = np.asarray(self._doc_lens, dtype=np.float32)
+
+        arrays = {
+            "term_hashes": term_hashes,
+            "term_offsets": term_offsets,
+            "postings_docs": postings_docs,
+            "postings_tfs": postings_tfs,
+            "idf": idf,
+            "doc_lens": doc_lens,
+            "doc_offsets": np.asarray(self._doc_offsets, dtype=np.int64),
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(self._tmp_path, f"{name}.npy"), values)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "n_docs": n_docs,
+            "avgdl": float(doc_lens.mean()) if n_docs else 0.0,
+            "tokenizer": self.tokenizer.config(),
+        }
+        with open(os.path.join(self._tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        # 替换旧索引，已删除文件的 mmap 仍然有效
+        old_path = f"{self.path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(self._tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        return BM25Index.load(self.path, self.tokenizer)
+
+
+def benchmark(docs: list[Document], queries: list[str], path: str = "bm25_index_benchmark", repeat: int = 3):
+    """对比 pickle + rank_bm25 与紧凑索引的构建、加载、查询耗时"""
+    import src.rag.retriever.bm25_handler as bm25_handler
+
+    def best_of(fn) -> float:
+        costs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            costs.append(time.perf_counter() - start)
+        return min(costs)
+
+    pickle_path, compact_path = f"{path}/pickle", f"{path}/compact"
+    os.makedirs(pickle_path, exist_ok=True)
+
+    report = {
+        "pickle": {
+            "build": best_of(lambda: bm25_handler.save_bm25(docs, save_path=pickle_path)),
+            "load": best_of(lambda: bm25_handler.load_bm25(pickle_path)),
+        },
+        "compact": {
+            "build": best_of(lambda: BM25Index.build(docs, compact_path)),
+            "load": best_of(lambda: BM25Index.load(compact_path)),
+        },
+    }
+
+    pickle_retriever = bm25_handler.load_bm25(pickle_path)
+    compact_index = BM25Index.load(compact_path)
+
+    def pickle_search(query: str):
+        scores = pickle_retriever.vectorizer.get_scores(pickle_retriever.preprocess_func(query))
+        return np.argsort(-scores)[:5]
+
+    report["pickle"]["query"] = best_of(lambda: [pickle_search(query) for query in queries]) / len(queries)
+    report["compact"]["query"] = best_of(
+        lambda: [compact_index.search(query, k=5) for query in queries]) / len(queries)
+
+    for name, costs in report.items():
+        logger.info(f"{name}: build {costs['build'] * 1000:.1f}ms, load {costs['load'] * 1000:.2f}ms, "
+                    f"query {costs['query'] * 1000:.3f}ms")
+    return report
+
+
+if __name__ == '__main__':
+    import src.rag.loader.pdf_parse as pdf_parse
+    from src import constant
+
+    with open(constant.test_question_path, "r", encoding="utf-8") as f:
+        benchmark_queries = [record["question"] for record in json.load(f)]
+    benchmark(pdf_parse.load_and_split(), benchmark_queries)
@@ -1,26 +1,39 @@
-import chromadb
-from langchain_chroma import Chroma
-
 import src.global_config as global_config
+from src.config.resource_registry import lazy_module_attrs, registry
 
-embedding_model = global_config.m3e_large_embed_model
 collection_name = "rag_docs"
 
-client_settings = chromadb.config.Settings(
-    chroma_server_host="localhost",
-    chroma_server_http_port=8000,
-    chroma_server_ssl_enabled=False,
-    chroma_client_auth_provider="chromadb.auth.token.TokenAuthClientProvider",
-    is_persistent=True,
-    allow_reset=True,
-)
-chroma_client = chromadb.Client(client_settings)
 
-chroma_store = Chroma(
-    client=chroma_client,
-    collection_name=collection_name,
-    embedding_function=embedding_model,
-)
+def _create_chroma_client():
+    import chromadb
+
+    client_settings = chromadb.config.Settings(
+        chroma_server_host="localhost",
+        chroma_server_http_port=8000,
+        chroma_server_ssl_enabled=False,
+        chroma_client_auth_provider="chromadb.auth.token.TokenAuthClientProvider",
+        is_persistent=True,
+        allow_reset=True,
+    )
+    return chromadb.Client(client_settings)
+
+
+def _create_chroma_store():
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        client=_chroma_client.get(),
+        collection_name=collection_name,
+        embedding_function=global_config.m3e_large_embed_model,
+    )
 
 
+# 首次访问 chroma_handler.chroma_store 时才连接并加载 m3e-large
+_chroma_client = registry.register("chroma_client", _create_chroma_client)
+_chroma_store = registry.register("chroma_store", _create_chroma_store)
 
+__getattr__ = lazy_module_attrs(__name__, {
+    "chroma_client": _chroma_client,
+    "chroma_store": _chroma_store,
+    "embedding_model": global_config._m3e_large_embed_model,
+})
@@ -0,0 +1,142 @@
+import logging
+from functools import cached_property
+
+import tiktoken
+from langchain_core.documents import Document
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _overlap_length(prev: str, nxt: str) -> int:
+    """prev 的后缀与 nxt 的前缀重合的最大长度（KMP 前缀函数，线性时间）"""
+    limit = min(len(prev), len(nxt))
+    if limit == 0:
+        return 0
+    text = nxt[:limit] + "\0" + prev[-limit:]
+    prefix = [0] * len(text)
+    for i in range(1, len(text)):
+        k = prefix[i - 1]
+        while k and text[i] != text[k]:
+            k = prefix[k - 1]
+        if text[i] == text[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1]
+
+
+def _shingles(text: str, size: int) -> set[str]:
+    text = "".join(text.split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class _Span:
+    """同一页中连续分块合并后的文本段"""
+
+    def __init__(self, doc: Document, score: float, rank: int):
+        self.page = doc.metadata.get("page")
+        self.last_index = doc.metadata.get("chunk_index")
+        self.text = doc.page_content
+        self.score = score
+        self.rank = rank
+
+    def extend(self, doc: Document, score: float, rank: int, min_overlap: int):
+        overlap = _overlap_length(self.text, doc.page_content)
+        if overlap >= min_overlap:
+            self.text += doc.page_content[overlap:]
+        else:
+            self.text += "\n" + doc.page_content
+        self.last_index = doc.metadata.get("chunk_index")
+        self.score = max(self.score, score)
+        self.rank = min(self.rank, rank)
+
+
+class ContextPacker:
+    """按 token 预算组装提示词上下文
+
+    1. 同一页中 chunk_index 相邻的分块合并为连续文本段，去掉切分时的 chunk_overlap 重叠部分；
+    2. 文本段按融合分数降序，与更高分文本段高度重合（字符 shingle 包含度）的近重复段被丢弃；
+    3. 依次放入预算内的文本段，首段超出预算时截断。
+
+    分数取检索结果的 hybrid_score，缺失时按检索返回顺序。
+    """
+
+    def __init__(self, token_budget: int = 3000, separator: str = f"{'*' * 10}", min_overlap_chars: int = 20,
+                 dedup_threshold: float = 0.9, shingle_size: int = 5, encoding_name: str = "cl100k_base"):
+        self.token_budget = token_budget
+        self.separator = separator
+        self.min_overlap_chars = min_overlap_chars
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.encoding_name = encoding_name
+
+    @cached_property
+    def encoding(self) -> tiktoken.Encoding:
+        # 首次组装时才加载词表
+        return tiktoken.get_encoding(self.encoding_name)
+
+    @cached_property
+    def _separator_tokens(self) -> int:
+        return len(self.encoding.encode(self.separator))
+
+    def _merge_spans(self, docs: list[Document]) -> list[_Span]:
+        seen = set()
+        entries = []
+        for rank, doc in enumerate(docs):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            if key in seen:
+                continue
+            seen.add(key)
+            entries.append((doc, doc.metadata.get("hybrid_score", -rank), rank))
+
+        # 同页按 chunk_index 排序，没有页码或序号的分块单独成段
+        def position(entry):
+            metadata = entry[0].metadata
+            return metadata.get("page") is None, metadata.get("page") or 0, metadata.get("chunk_index") or 0, entry[2]
+
+        spans: list[_Span] = []
+        for doc, score, rank in sorted(entries, key=position):
+            page, chunk_index = doc.metadata.get("page"), doc.metadata.get("chunk_index")
+            last = spans[-1] if spans else None
+            if (last is not None and page is not None and chunk_index is not None and last.page == page
+                    and last.last_index is not None and chunk_index == last.last_index + 1):
+                last.extend(doc, score, rank, self.min_overlap_chars)
+            else:
+                spans.append(_Span(doc, score, rank))
+        return spans
+
+    def _drop_near_duplicates(self, spans: list[_Span]) -> list[_Span]:
+        kept: list[tuple[_Span, set[str]]] = []
+        for span in sorted(spans, key=lambda s: (-s.score, s.rank)):
+            shingles = _shingles(span.text, self.shingle_size)
+            if any(len(shingles & other) >= self.dedup_threshold * len(shingles) for _, other in kept):
+                continue
+            kept.append((span, shingles))
+        return [span for span, _ in kept]
+
+    def pack(self, docs: list[Document]) -> str | None:
+        if not docs:
+            return None
+
+        spans = self._drop_near_duplicates(self._merge_spans(docs))
+        span_tokens = self.encoding.encode_batch([span.text for span in spans])
+
+        texts = []
+        used = 0
+        for span, tokens in zip(spans, span_tokens):
+            cost = len(tokens) + (self._separator_tokens if texts else 0)
+            if used + cost <= self.token_budget:
+                texts.append(span.text)
+                used += cost
+            elif not texts:
+                texts.append(self.encoding.decode(tokens[:self.token_budget]))
+                used = self.token_budget
+
+        original = sum(len(tokens) for tokens in self.encoding.encode_batch([doc.page_content for doc in docs])) \
+            + self._separator_tokens * (len(docs) - 1)
+        logger.info(f"[context] {len(docs)} 个分块 -> {len(texts)} 段, "
+                    f"token {original} -> {used}, 节省 {original - used}")
+        return self.separator.join(texts)
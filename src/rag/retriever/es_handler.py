@@ -1,14 +1,29 @@
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers.vectorstore import BM25Strategy
-from langchain_elasticsearch import ElasticsearchStore
+from src.config.resource_registry import lazy_module_attrs, registry
 
-# 初始化 Elasticsearch 客户端
-es_client = Elasticsearch("http://localhost:9200")
 index_name = "rag_docs"
 
-# 构建 ElasticsearchStore
-es_store = ElasticsearchStore(
-    es_url="http://localhost:9200",
-    index_name=index_name,
-    strategy=BM25Strategy(),
-)
+
+def _create_es_client():
+    from elasticsearch import Elasticsearch
+
+    # 初始化 Elasticsearch 客户端
+    return Elasticsearch("http://localhost:9200")
+
+
+def _create_es_store():
+    from elasticsearch.helpers.vectorstore import BM25Strategy
+    from langchain_elasticsearch import ElasticsearchStore
+
+    # 构建 ElasticsearchStore
+    return ElasticsearchStore(
+        es_url="http://localhost:9200",
+        index_name=index_name,
+        strategy=BM25Strategy(),
+    )
+
+
+# 首次访问 es_handler.es_client / es_handler.es_store 时才建立连接
+_es_client = registry.register("es_client", _create_es_client)
+_es_store = registry.register("es_store", _create_es_store)
+
+__getattr__ = lazy_module_attrs(__name__, {"es_client": _es_client, "es_store": _es_store})
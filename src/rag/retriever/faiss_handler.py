@@ -1,43 +1,342 @@
+import json
 import logging
+import math
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import src.global_config as global_config
+from src import constant
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# flat: 精确检索; ivf: 倒排聚类; hnsw: 图索引; ivfpq: 倒排聚类 + 乘积量化压缩
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# faiss 建议每个聚类中心至少 39 个训练样本
+_MIN_POINTS_PER_CENTROID = 39
+
+# 与索引一同保存的嵌入模型记录；没有该文件的旧索引由 openai 嵌入模型构建
+_EMBEDDING_INFO_FILE = "embedding.json"
+_LEGACY_EMBED_MODEL = "openai"
+
+
+def get_embed_model() -> Embeddings:
+    """FAISS 索引使用的嵌入模型，m3e-large 为本地模型，无需外部服务"""
+    if constant.faiss_embed_model == "m3e-large":
+        return global_config.m3e_large_embed_model
+    return global_config.embed_model
+
+
+# ===== 嵌入模型记录 =====
+
+def load_embedding_info(folder_path: str = None) -> dict:
+    """索引使用的嵌入模型与维度，旧索引只能确定模型"""
+    path = os.path.join(folder_path or constant.faiss_store_path, _EMBEDDING_INFO_FILE)
+    if not os.path.exists(path):
+        return {"model": _LEGACY_EMBED_MODEL, "dim": None}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_embedding_info(dim: int, folder_path: str = None):
+    path = os.path.join(folder_path or constant.faiss_store_path, _EMBEDDING_INFO_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"model": constant.faiss_embed_model, "dim": dim}, f)
+
+
+def embedding_matches(folder_path: str = None) -> bool:
+    """磁盘上的索引是否由当前嵌入模型构建，没有索引时视为一致"""
+    folder_path = folder_path or constant.faiss_store_path
+    if not os.path.exists(os.path.join(folder_path, "index.faiss")):
+        return True
+    return load_embedding_info(folder_path)["model"] == constant.faiss_embed_model
+
+
+def save_store(store: FAISS, folder_path: str = None):
+    """保存索引及其嵌入模型记录"""
+    folder_path = folder_path or constant.faiss_store_path
+    store.save_local(folder_path)
+    save_embedding_info(store.index.d, folder_path)
+
+
+# ===== 索引构建 =====
+
+def build_index(dim: int, n_vectors: int, index_type: str = None) -> faiss.Index:
+    """创建未训练的内积索引，聚类数、PQ 参数根据向量数与维度自动收缩"""
+    index_type = index_type or constant.faiss_index_type
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}, expected one of {INDEX_TYPES}")
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, constant.faiss_hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = max(40, 2 * constant.faiss_hnsw_m)
+        return index
+
+    nlist = max(1, min(constant.faiss_nlist, n_vectors // _MIN_POINTS_PER_CENTROID))
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+
+    # 子向量个数需整除维度，码本大小不超过训练样本数
+    pq_m = max(m for m in range(1, min(constant.faiss_pq_m, dim) + 1) if dim % m == 0)
+    nbits = max(1, min(8, int(math.log2(max(n_vectors, 2)))))
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+
+
+def index_type_of(index: faiss.Index) -> str | None:
+    """返回索引类型，旧版 L2 索引返回 None"""
+    if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+        return None
+    # IndexIVFPQ 与 IndexIVFFlat 都是 IndexIVF 的子类，需先判断 PQ
+    for index_type, cls in (("ivfpq", faiss.IndexIVFPQ), ("ivf", faiss.IndexIVFFlat),
+                            ("hnsw", faiss.IndexHNSWFlat), ("flat", faiss.IndexFlat)):
+        if isinstance(index, cls):
+            return index_type
+    return None
+
+
+def configure_search(index: faiss.Index, nprobe: int = None, ef_search: int = None):
+    """设置查询参数：IVF 探查的聚类数、HNSW 候选队列长度"""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe or constant.faiss_nprobe, index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or constant.faiss_ef_search
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.array(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _wrap(index: faiss.Index, docstore: InMemoryDocstore, index_to_docstore_id: dict[int, str],
+          embeddings: Embeddings) -> FAISS:
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        # 查询与新增向量由 LangChain 归一化，分数即余弦相似度；
+        # LangChain 对该组合会给出不适用的警告，但归一化仍然生效
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return FAISS(embeddings, index, docstore, index_to_docstore_id,
+                         normalize_L2=True, distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def create_vectorstore(text_embeddings: list[tuple[str, list[float]]], embeddings: Embeddings,
+                       metadatas: list[dict], ids: list[str], index_type: str = None) -> FAISS:
+    """用已计算的向量构建指定类型的索引"""
+    vectors = _normalize([vector for _, vector in text_embeddings])
+    index = build_index(vectors.shape[1], len(vectors), index_type)
+
+    start = time.perf_counter()
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    configure_search(index)
+    logger.info(f"FAISS {index_type or constant.faiss_index_type} 索引构建完成，"
+                f"{len(vectors)} 条向量，耗时 {time.perf_counter() - start:.2f}s")
+
+    docstore = InMemoryDocstore({
+        chunk_id: Document(page_content=text, metadata=metadata)
+        for (text, _), metadata, chunk_id in zip(text_embeddings, metadatas, ids)
+    })
+    return _wrap(index, docstore, dict(enumerate(ids)), embeddings)
+
+
+def reconstruct_vectors(store: FAISS) -> tuple[list[str], np.ndarray]:
+    """取出索引中的全部向量，IVF-PQ 为有损重建"""
+    index = store.index
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    positions = sorted(store.index_to_docstore_id)
+    vectors = np.vstack([index.reconstruct(position) for position in positions]) if positions \
+        else np.zeros((0, index.d), dtype=np.float32)
+    return [store.index_to_docstore_id[position] for position in positions], vectors
+
+
+def merge_vectorstore(store: FAISS, text_embeddings: list[tuple[str, list[float]]], metadatas: list[dict],
+                      ids: list[str], stale_ids: list[str], index_type: str = None) -> FAISS:
+    """将新增向量合并进已有索引，写入已存在的 chunk_id 视为覆盖
+
+    只有 flat 索引原地增删：LangChain 删除后会压缩位置映射，IndexFlat 删除时同样前移后续向量，两者一致；
+    IVF 删除时保留原有标签，新增向量会复用仍被映射的位置，因此 IVF、HNSW、类型变化与旧版 L2 索引
+    均取出保留的向量与新增向量一起重建。
+    """
+    index_type = index_type or constant.faiss_index_type
+    if text_embeddings and len(text_embeddings[0][1]) != store.index.d:
+        raise ValueError(f"New vectors have dimension {len(text_embeddings[0][1])} but the index has "
+                         f"{store.index.d}; rebuild with ingest(force=True)")
+    existing_ids = set(store.index_to_docstore_id.values())
+    removed = existing_ids & (set(stale_ids) | set(ids))
+
+    if index_type_of(store.index) == index_type == "flat":
+        if removed:
+            store.delete(ids=list(removed))
+        if text_embeddings:
+            store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return store
+
+    kept_ids, kept_vectors = reconstruct_vectors(store)
+    if index_type_of(store.index) == "ivfpq":
+        logger.warning("IVF-PQ 索引重建使用有损向量，建议使用 ingest(force=True) 完整重建")
+    kept = [(chunk_id, vector) for chunk_id, vector in zip(kept_ids, kept_vectors) if chunk_id not in removed]
+    kept_docs = [store.docstore.search(chunk_id) for chunk_id, _ in kept]
+
+    logger.info(f"FAISS 索引由 {index_type_of(store.index) or 'l2'} 重建为 {index_type}")
+    return create_vectorstore(
+        [(doc.page_content, vector) for doc, (_, vector) in zip(kept_docs, kept)] + list(text_embeddings),
+        store.embedding_function,
+        [doc.metadata for doc in kept_docs] + list(metadatas),
+        [chunk_id for chunk_id, _ in kept] + list(ids),
+        index_type,
+    )
+
 
 def save_vectorstore(split_docs: list[Document]):
-    # 假设 split_docs 是你的文档列表
-    faiss_vector_store = FAISS.from_documents(
-        documents=split_docs,
-        embedding=global_config.embed_model,
+    embed_model = get_embed_model()
+    texts = [doc.page_content for doc in split_docs]
+    faiss_vector_store = create_vectorstore(
+        list(zip(texts, embed_model.embed_documents(texts))),
+        embed_model,
+        [doc.metadata for doc in split_docs],
+        [doc.metadata.get("chunk_id") or str(i) for i, doc in enumerate(split_docs)],
     )
 
     # 保存到本地磁盘
-    faiss_vector_store.save_local("manual_text_faiss_index")
+    save_store(faiss_vector_store)
     logger.info("FAISS 索引已保存至 faiss_index 文件夹")
     return faiss_vector_store
 
 
 # 从磁盘加载 FAISS 向量存储
 def load_existing_vectorstore():
+    if not embedding_matches():
+        raise ValueError(f"FAISS index was built with {load_embedding_info()['model']} but FAISS_EMBED_MODEL is "
+                         f"{constant.faiss_embed_model}; rebuild with ingest(force=True)")
     # 加载时需要提供相同的嵌入模型
     loaded_vector_store = FAISS.load_local(
-        folder_path="manual_text_faiss_index",
-        embeddings=global_config.embed_model,
+        folder_path=constant.faiss_store_path,
+        embeddings=get_embed_model(),
         # 必要的安全确认参数
         allow_dangerous_deserialization=True,
     )
+    # 距离类型不随索引保存，按索引的度量恢复
+    loaded_vector_store = _wrap(loaded_vector_store.index, loaded_vector_store.docstore,
+                                loaded_vector_store.index_to_docstore_id, loaded_vector_store.embedding_function)
+    configure_search(loaded_vector_store.index)
     logger.info("FAISS 索引已从磁盘加载")
     return loaded_vector_store
 
 
+# ===== 查询 =====
+
+def to_cosine(store: FAISS, scores: np.ndarray) -> np.ndarray:
+    """将索引返回的分数换算为余弦相似度，旧版 L2 索引按单位向量的平方距离换算"""
+    if store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return scores
+    return 1 - scores / 2
+
+
+def batch_search(store: FAISS, query_vectors, k: int = 10,
+                 threshold: float = None) -> list[list[tuple[Document, float]]]:
+    """一次检索多个查询向量，返回每个查询的 [(文档, 余弦相似度)]，按相似度降序"""
+    query_vectors = _normalize(query_vectors)
+    scores, positions = store.index.search(query_vectors, k)
+    scores = to_cosine(store, scores)
+
+    results = []
+    for row_scores, row_positions in zip(scores, positions):
+        hits = []
+        for score, position in zip(row_scores, row_positions):
+            # 结果不足 k 条时以 -1 填充
+            if position == -1 or (threshold is not None and score < threshold):
+                continue
+            hits.append((store.docstore.search(store.index_to_docstore_id[position]), float(score)))
+        results.append(hits)
+    return results
+
+
+def batch_search_texts(store: FAISS, queries: list[str], k: int = 10,
+                       threshold: float = None) -> list[list[tuple[Document, float]]]:
+    """并发向量化查询文本后批量检索，m3e 的查询会被微批合并"""
+    embed_query = store.embedding_function.embed_query
+    with ThreadPoolExecutor(max_workers=min(8, max(1, len(queries)))) as executor:
+        query_vectors = list(executor.map(embed_query, queries))
+    return batch_search(store, query_vectors, k, threshold)
+
+
 def faiss_retriever_with_score(faiss_vector_store: FAISS, query: str, k: int = 10, threshold: float = 0.6):
-    # 获取文档及相似度分数
-    docs_with_scores = faiss_vector_store.similarity_search_with_score(query, k=k)
-    docs_with_scores.sort(key=lambda x: x[1])
-    # 根据分数过滤
-    filtered_docs = [doc for doc, l2_score in docs_with_scores if l2_score <= 1 - threshold]
-    return filtered_docs
+    # 只保留余弦相似度不低于阈值的文档
+    return [doc for doc, _ in batch_search_texts(faiss_vector_store, [query], k, threshold)[0]]
+
+
+# ===== 评测 =====
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int = 10, index_types=INDEX_TYPES,
+              repeat: int = 3) -> dict:
+    """对比各索引类型的 recall@k、单条查询耗时、内存占用与构建耗时，以 flat 结果为准"""
+    vectors, queries = _normalize(vectors), _normalize(queries)
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    report = {}
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(vectors.shape[1], len(vectors), index_type)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        configure_search(index)
+        build_cost = time.perf_counter() - start
+
+        costs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            costs.append(time.perf_counter() - start)
+
+        recall = np.mean([len(set(row_found) & set(row_truth)) / k for row_found, row_truth in zip(found, truth)])
+        report[index_type] = {
+            "recall": float(recall),
+            "query_ms": min(costs) / len(queries) * 1000,
+            "memory_mb": faiss.serialize_index(index).nbytes / 2 ** 20,
+            "build_s": build_cost,
+        }
+        logger.info(f"{index_type}: recall@{k} {recall:.3f}, query {report[index_type]['query_ms']:.3f}ms, "
+                    f"memory {report[index_type]['memory_mb']:.1f}MB, build {build_cost:.2f}s")
+    return report
+
+
+if __name__ == '__main__':
+    import json
+
+    store = load_existing_vectorstore()
+    _, doc_vectors = reconstruct_vectors(store)
+    with open(constant.test_question_path, "r", encoding="utf-8") as f:
+        questions = [record["question"] for record in json.load(f)]
+    question_vectors = np.array([store.embedding_function.embed_query(q) for q in questions], dtype=np.float32)
+
+    logger.info(f"== 手册原始规模: {len(doc_vectors)} 条 ==")
+    benchmark(doc_vectors, question_vectors)
+
+    # 在原始向量上叠加噪声扩充到 10 万条，模拟多本手册的规模
+    rng = np.random.default_rng(0)
+    scale = 100_000
+    noisy = doc_vectors[rng.integers(0, len(doc_vectors), scale)]
+    noisy = noisy + rng.normal(0, 0.02, noisy.shape).astype(np.float32)
+    logger.info(f"== 扩充规模: {scale} 条 ==")
+    benchmark(noisy, question_vectors)
@@ -0,0 +1,124 @@
+import logging
+import time
+
+import numpy as np
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 参考 Cormack et al. 的 RRF 默认常数
+RRF_K = 60
+
+
+def min_max(scores: np.ndarray) -> np.ndarray:
+    """线性缩放到 [0, 1]，分数全部相同时返回 0（与 MinMaxScaler 一致）"""
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+def z_score(scores: np.ndarray) -> np.ndarray:
+    """标准化为均值 0、标准差 1，标准差为 0 时返回 0"""
+    if scores.size == 0:
+        return scores
+    std = scores.std()
+    if std == 0:
+        return np.zeros_like(scores)
+    return (scores - scores.mean()) / std
+
+
+def reciprocal_rank(scores: np.ndarray, k: int = RRF_K) -> np.ndarray:
+    """按分数降序排名后取 1 / (k + rank)，rank 从 1 开始"""
+    ranks = np.empty(scores.size, dtype=np.float64)
+    ranks[np.argsort(-scores, kind="stable")] = np.arange(1, scores.size + 1)
+    return 1.0 / (k + ranks)
+
+
+NORMALIZERS = {
+    "min_max": min_max,
+    "z_score": z_score,
+    "rrf": reciprocal_rank,
+}
+
+
+def fuse(channels: list[tuple[list[str], np.ndarray, float]], strategy: str = "min_max",
+         top_k: int = None) -> tuple[list[str], np.ndarray]:
+    """融合多个检索通道的结果
+
+    Args:
+        channels: 每个通道的 (chunk_id 列表, 分数数组(越大越相关), 权重)
+        strategy: min_max / z_score / rrf
+        top_k: 返回条数，None 表示全部
+
+    Returns:
+        (按融合分数降序的 chunk_id 列表, 对应的融合分数)
+    """
+    normalize = NORMALIZERS.get(strategy)
+    if normalize is None:
+        raise ValueError(f"Unknown fusion strategy: {strategy}, expected one of {list(NORMALIZERS)}")
+
+    # chunk_id -> 融合数组下标
+    positions: dict[str, int] = {}
+    channel_positions = [np.fromiter((positions.setdefault(chunk_id, len(positions)) for chunk_id in ids),
+                                     dtype=np.int64, count=len(ids))
+                         for ids, _, _ in channels]
+
+    fused = np.zeros(len(positions), dtype=np.float64)
+    for (_, scores, weight), index in zip(channels, channel_positions):
+        if index.size:
+            np.add.at(fused, index, weight * normalize(np.asarray(scores, dtype=np.float64)))
+
+    order = np.argsort(-fused, kind="stable")
+    if top_k is not None:
+        order = order[:top_k]
+    ids = list(positions)
+    return [ids[i] for i in order], fused[order]
+
+
+def benchmark(ks: tuple[int, ...] = (5, 50, 500), repeat: int = 2000):
+    """对比各融合策略与旧版 MinMaxScaler + 文本字典合并的单次查询耗时"""
+    rng = np.random.default_rng(0)
+    for k in ks:
+        # 两个通道约一半结果重叠
+        vector_ids = [f"chunk_{i}" for i in range(k)]
+        keyword_ids = [f"chunk_{i}" for i in range(k // 2, k // 2 + k)]
+        vector_scores, keyword_scores = rng.random(k), rng.random(k) * 20
+        channels = [(vector_ids, vector_scores, 0.7), (keyword_ids, keyword_scores, 0.3)]
+
+        costs = {}
+        for strategy in NORMALIZERS:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fuse(channels, strategy, top_k=k)
+            costs[strategy] = (time.perf_counter() - start) / repeat * 1e6
+
+        try:
+            costs["legacy_min_max"] = _legacy_cost(channels, repeat)
+        except ImportError:
+            pass
+
+        logger.info(f"k={k}: " + ", ".join(f"{name} {cost:.1f}us" for name, cost in costs.items()))
+
+
+def _legacy_cost(channels, repeat: int) -> float:
+    """旧实现：每次查询新建 MinMaxScaler，按文本字典合并"""
+    from sklearn.preprocessing import MinMaxScaler
+
+    texts = [[f"第 {chunk_id} 段内容" * 20 for chunk_id in ids] for ids, _, _ in channels]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        merged = {}
+        for channel_texts, (_, scores, weight) in zip(texts, channels):
+            norm = MinMaxScaler().fit_transform(np.array(scores).reshape(-1, 1)).flatten()
+            for text, score in zip(channel_texts, norm):
+                merged[text] = merged.get(text, 0.0) + weight * score
+        sorted(merged.items(), key=lambda x: x[1], reverse=True)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    benchmark()
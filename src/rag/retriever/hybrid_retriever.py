@@ -1,96 +1,158 @@
-from elasticsearch import Elasticsearch
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 from langchain.schema import Document
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.vectorstores import VectorStore
 from pydantic import Field
-from sklearn.preprocessing import MinMaxScaler
 import numpy as np
 
+from src import constant
+from src.config import tracing
+from src.rag.loader.content_hash import stable_hash
+import src.rag.retriever.fusion as fusion
+
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 各检索通道共享的线程池，同步调用时并发查询两个通道
+_channel_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hybrid-channel")
+
 
 class HybridRetriever(BaseRetriever):
     vector_store: VectorStore
     keyword_store: VectorStore
     top_k: int = Field(default=5, description="Number of documents to return")
     alpha: float = Field(default=0.7, description="vector_store 所占权重比例")
+    vector_timeout: float = Field(default=3.0, description="向量检索通道超时时间（秒）")
+    keyword_timeout: float = Field(default=3.0, description="关键词检索通道超时时间（秒）")
+    vector_channel: str = Field(default="chroma", description="向量检索通道名称，用于来源标签与耗时记录")
+    keyword_channel: str = Field(default="elastic", description="关键词检索通道名称，用于来源标签与耗时记录")
+    vector_score_is_distance: bool = Field(default=True, description="向量通道返回的是否为距离（越小越相关）")
+    fusion_strategy: str = Field(default="min_max", description="分数融合策略: min_max / z_score / rrf")
+
+    def _search_channel(self, name: str, store: VectorStore, query: str) \
+            -> tuple[list[tuple[Document, float]], float]:
+        start = time.perf_counter()
+        with tracing.span("retrieve_channel", channel=name):
+            results = store.similarity_search_with_score(query, k=self.top_k)
+        return results, (time.perf_counter() - start) * 1000
+
+    async def _asearch_channel(self, name: str, store: VectorStore, query: str, timeout: float) \
+            -> tuple[list[tuple[Document, float]], float]:
+        start = time.perf_counter()
+        with tracing.span("retrieve_channel", channel=name):
+            results = await asyncio.wait_for(store.asimilarity_search_with_score(query, k=self.top_k), timeout)
+        return results, (time.perf_counter() - start) * 1000
+
+    def _channels(self) -> list[tuple[str, VectorStore, float]]:
+        return [
+            (self.vector_channel, self.vector_store, self.vector_timeout),
+            (self.keyword_channel, self.keyword_store, self.keyword_timeout),
+        ]
+
+    @staticmethod
+    def _collect(name: str, outcome, timeout: float, results: dict, timings: dict):
+        """记录单个通道的结果；超时或异常时降级为空结果"""
+        if isinstance(outcome, tuple):
+            results[name], elapsed = outcome
+            timings[name] = {"status": "ok", "ms": round(elapsed, 2)}
+            return
+
+        results[name] = []
+        if isinstance(outcome, (FutureTimeoutError, asyncio.TimeoutError)):
+            logger.warning(f"检索通道 {name} 超时（{timeout}s），仅使用其他通道结果")
+            timings[name] = {"status": "timeout", "ms": round(timeout * 1000, 2)}
+        else:
+            logger.warning(f"检索通道 {name} 异常，仅使用其他通道结果: {outcome!r}")
+            timings[name] = {"status": "error", "error": repr(outcome)}
 
     def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
-        # 获取两个通道的文档
-        vector_results = self.vector_store.similarity_search_with_score(query, k=self.top_k)
-        keyword_results = self.keyword_store.similarity_search_with_score(query, k=self.top_k)
-
-        # 解包为文档和分数，空则设默认空列表
-        vector_docs, vector_scores = zip(*vector_results) if vector_results else ([], [])
-        keyword_docs, keyword_scores = zip(*keyword_results) if keyword_results else ([], [])
-
-        vector_scores = HybridRetriever.normalize_scores(vector_scores)
-        keyword_scores = HybridRetriever.normalize_scores(keyword_scores)
-
-        # 为每条文档设置来源标签
-        for doc in vector_docs:
-            doc.metadata["source"] = "chroma"
-        for doc in keyword_docs:
-            doc.metadata["source"] = "elastic"
-
-        # 去重并合并分数
-        doc_dict = {}
-        # 处理向量检索结果
-        for doc, score in zip(vector_docs, vector_scores):
-            key = doc.page_content
-            hybrid_score = self.alpha * score
-            if key in doc_dict:
-                doc_dict[key].metadata["hybrid_score"] += hybrid_score
-            else:
-                # 避免修改原始文档
-                doc = doc.model_copy()
-                doc.metadata["hybrid_score"] = hybrid_score
-                doc_dict[key] = doc
-
-        # 处理关键词检索结果
-        for doc, score in zip(keyword_docs, keyword_scores):
-            key = doc.page_content
-            hybrid_score = (1 - self.alpha) * score
-            if key in doc_dict:
-                doc_dict[key].metadata["hybrid_score"] += hybrid_score
-            else:
-                # 避免修改原始文档
-                doc = doc.model_copy()
-                doc.metadata["hybrid_score"] = hybrid_score
-                doc_dict[key] = doc
-
-        sorted_docs = sorted(doc_dict.values(), key=lambda d: d.metadata["hybrid_score"], reverse=True)
-        return sorted_docs[:self.top_k]
+        # 并发查询两个通道，每个通道从提交时刻开始计算超时
+        start = time.monotonic()
+        # 复制当前上下文，通道耗时计入发起检索的请求
+        futures = [(name, _channel_executor.submit(contextvars.copy_context().run, self._search_channel,
+                                                   name, store, query), timeout)
+                   for name, store, timeout in self._channels()]
+
+        results, timings = {}, {}
+        for name, future, timeout in futures:
+            try:
+                outcome = future.result(timeout=max(0.0, start + timeout - time.monotonic()))
+            except Exception as e:
+                outcome = e
+            self._collect(name, outcome, timeout, results, timings)
+
+        return self._merge_results(results[self.vector_channel], results[self.keyword_channel], timings)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        channels = self._channels()
+        outcomes = await asyncio.gather(
+            *(self._asearch_channel(name, store, query, timeout) for name, store, timeout in channels),
+            return_exceptions=True
+        )
+
+        results, timings = {}, {}
+        for (name, _, timeout), outcome in zip(channels, outcomes):
+            self._collect(name, outcome, timeout, results, timings)
+
+        return self._merge_results(results[self.vector_channel], results[self.keyword_channel], timings)
+
+    def _merge_results(self, vector_results: list[tuple[Document, float]],
+                       keyword_results: list[tuple[Document, float]], timings: dict) -> list[Document]:
+        # 以 chunk_id 作为合并键，旧索引中没有 chunk_id 的文档退化为内容哈希
+        docs: dict[str, tuple[Document, str]] = {}
+        channels = []
+        for results, name, weight, is_distance in (
+                (vector_results, self.vector_channel, self.alpha, self.vector_score_is_distance),
+                (keyword_results, self.keyword_channel, 1 - self.alpha, False)):
+            ids = []
+            for doc, _ in results:
+                chunk_id = doc.metadata.get("chunk_id") or stable_hash(doc.page_content)
+                ids.append(chunk_id)
+                # 同一文档出现在两个通道时，保留先出现的通道作为来源
+                docs.setdefault(chunk_id, (doc, name))
+            scores = np.fromiter((score for _, score in results), dtype=np.float64, count=len(results))
+            # 距离越小越相关，取负后统一为越大越相关
+            channels.append((ids, -scores if is_distance else scores, weight))
+
+        with tracing.span("fusion", strategy=self.fusion_strategy):
+            fused_ids, fused_scores = fusion.fuse(channels, self.fusion_strategy, top_k=self.top_k)
+
+        merged = []
+        for chunk_id, score in zip(fused_ids, fused_scores):
+            doc, source = docs[chunk_id]
+            # 新建文档，避免修改原始文档
+            merged.append(Document(page_content=doc.page_content, metadata={
+                **doc.metadata,
+                "source": source,
+                "hybrid_score": float(score),
+                # 记录各通道耗时与状态
+                "retrieval_timing": timings,
+            }))
+        return merged
 
     # 提取分数并归一化
     @classmethod
     def normalize_scores(cls, scores):
-        if not scores:
-            return []
-        # 归一化
-        scaler = MinMaxScaler()
-        norm_scores = scaler.fit_transform(np.array(scores).reshape(-1, 1)).flatten()
-        return norm_scores
+        return fusion.min_max(np.asarray(scores, dtype=np.float64))
 
     @classmethod
-    def create_hybrid_retriever(cls, split_docs: list[Document]) -> "HybridRetriever":
-        import src.rag.retriever.es_handler as es_handler
-        import src.rag.retriever.chroma_handler as chroma_handler
-
-        vector_store = chroma_handler.chroma_store
-        keyword_store = es_handler.es_store
-
-        split_docs = [
-            Document(page_content=doc.page_content, metadata=HybridRetriever.clean_metadata(doc.metadata))
-            for doc in split_docs
-        ]
-
-        vector_store.add_documents(split_docs)
-        keyword_store.add_documents(split_docs)
-
-        return HybridRetriever(vector_store=vector_store, keyword_store=keyword_store)
+    def load_hybrid_retriever(cls) -> "HybridRetriever":
+        """按 constant.retriever_backend 加载远程或进程内检索器"""
+        if constant.retriever_backend == "local":
+            return cls.load_local_hybrid_retriever()
+        return cls.load_remote_hybrid_retriever()
 
     @classmethod
-    def load_hybrid_retriever(cls) -> "HybridRetriever":
+    def load_remote_hybrid_retriever(cls) -> "HybridRetriever":
         import src.rag.retriever.es_handler as es_handler
 
         import src.rag.retriever.chroma_handler as chroma_handler
@@ -99,6 +161,25 @@ class HybridRetriever(BaseRetriever):
 
         return HybridRetriever(vector_store=vector_store, keyword_store=keyword_store)
 
+    @classmethod
+    def load_local_hybrid_retriever(cls) -> "HybridRetriever":
+        """从磁盘加载 FAISS 与 BM25 索引，检索全部在进程内完成，不依赖外部服务"""
+        from langchain_community.vectorstores.utils import DistanceStrategy
+
+        import src.rag.retriever.bm25_handler as bm25_handler
+        import src.rag.retriever.faiss_handler as faiss_handler
+
+        vector_store = faiss_handler.load_existing_vectorstore()
+        keyword_store = bm25_handler.load_bm25_store(constant.bm25_store_path)
+
+        return HybridRetriever(
+            vector_store=vector_store,
+            keyword_store=keyword_store,
+            vector_channel="faiss",
+            keyword_channel="bm25",
+            vector_score_is_distance=vector_store.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+
     @classmethod
     def clean_metadata(cls, metadata):
         cleaned = {}
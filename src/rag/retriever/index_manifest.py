@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+class IndexManifest:
+    """记录已写入各存储（Chroma / ES / Mongo）的分块，用于增量索引
+
+    文件内容：
+        source_hash: 建索引时 PDF 文件的 sha256
+        sinks: 写入的存储名称，存储组合变化时需要重新写入全部分块
+        chunks: chunk_id -> 页码
+    """
+
+    def __init__(self, path: str, source_hash: str = None, chunks: dict[str, int] = None,
+                 sinks: list[str] = None):
+        self.path = path
+        self.source_hash = source_hash
+        self.chunks = chunks or {}
+        self.sinks = sinks
+
+    @classmethod
+    def load(cls, path: str) -> "IndexManifest":
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data.get("version") != MANIFEST_VERSION:
+            logger.warning(f"索引清单版本不匹配，将重建索引: {path}")
+            return cls(path)
+        return cls(path, data.get("source_hash"), data.get("chunks"), data.get("sinks"))
+
+    def save(self):
+        """原子写入，避免中途崩溃留下半个文件"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "source_hash": self.source_hash,
+                "sinks": self.sinks,
+                "chunks": self.chunks,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def is_up_to_date(self, source_hash: str, sinks: list[str] = None) -> bool:
+        if sinks is not None and sorted(sinks) != sorted(self.sinks or []):
+            return False
+        return self.source_hash == source_hash and bool(self.chunks)
+
+    def replace(self, source_hash: str, chunks: dict[str, int], sinks: list[str] = None):
+        self.source_hash = source_hash
+        self.chunks = dict(chunks)
+        self.sinks = sinks
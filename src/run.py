@@ -1,24 +1,54 @@
 import logging
+import threading
+from collections import OrderedDict
 
 from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.runnables import RunnableBranch, RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableBranch, RunnableLambda, RunnableParallel, \
+    RunnablePassthrough
 
 import src.global_config as global_config
+import src.rag.llm.answer_cache as answer_cache
 import src.rag.llm.rerank_model as rerank_model
-import src.rag.loader.pdf_parse as pdf_parse
+import src.rag.loader.ingest_pipeline as ingest_pipeline
+from src import constant
+from src.config import tracing
+from src.config.resource_registry import registry
 from src.rag.prompt.content_themes_prompt import split_theme_prompt_template, ContentResponse
 from src.rag.prompt.hyde_prompt import hyde_prompt
+from src.rag.retriever.context_packer import ContextPacker
 from src.rag.retriever.hybrid_retriever import HybridRetriever
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-llm = global_config.llm
-embed_model = global_config.embed_model
+# 提示词模板只解析一次
+split_theme_prompt = PromptTemplate.from_template(split_theme_prompt_template)
+hyde_prompt_template = PromptTemplate.from_template(hyde_prompt)
+
+context_packer = ContextPacker(token_budget=constant.context_token_budget)
+
+# 已构建的链，按 (链名, 检索器, 模型, 参数) 复用；链持有检索器与模型，条数有上限，超出时淘汰最久未用的
+_MAX_CHAINS = 32
+_chains: OrderedDict[tuple, Runnable] = OrderedDict()
+_chains_lock = threading.Lock()
+
+
+def _cached_chain(key: tuple, build) -> Runnable:
+    with _chains_lock:
+        chain = _chains.get(key)
+        if chain is None:
+            # 挂上耗时与 token 统计回调，子运行（检索器、LLM）自动继承
+            chain = _chains[key] = build().with_config(callbacks=[tracing.callback_handler])
+            while len(_chains) > _MAX_CHAINS:
+                _chains.popitem(last=False)
+        else:
+            _chains.move_to_end(key)
+    return chain
 
 
 def format_docs(docs):
@@ -28,10 +58,15 @@ def format_docs(docs):
     return f"{'*' * 10}".join(doc.page_content for doc in docs)
 
 
-def query_multi_content(question: str, retriever: BaseRetriever) -> ContentResponse:
-    split_theme_prompt = PromptTemplate.from_template(split_theme_prompt_template)
+def pack_docs(docs):
+    """合并重叠分块、去除近重复后按 token 预算拼接上下文"""
+    with tracing.span("context_pack"):
+        return context_packer.pack(docs)
+
 
-    structured_llm = llm.with_structured_output(ContentResponse, method="function_calling")
+def build_theme_chain(retriever: BaseRetriever, chat_model: BaseChatModel = None) -> Runnable:
+    """检索 + 主题提取：输入检索语句，输出 ContentResponse"""
+    structured_llm = (chat_model or global_config.llm).with_structured_output(ContentResponse, method="function_calling")
 
     # 定义空响应处理分支
     empty_response = lambda _: ContentResponse(content_list=[])
@@ -43,45 +78,136 @@ def query_multi_content(question: str, retriever: BaseRetriever) -> ContentRespo
         split_theme_prompt | structured_llm
     )
 
-    rag_chain = {"context": retriever | format_docs} | content_check_branch
+    return ({"context": retriever | pack_docs} | content_check_branch).with_config(
+        metadata={"stage": "query_multi_content"})
+
+
+def build_hyde_chain(chat_model: BaseChatModel = None) -> Runnable:
+    """HyDE：输入问题，输出假设答案"""
+    return ({"question": RunnablePassthrough()}
+            | hyde_prompt_template
+            | (chat_model or global_config.llm)
+            | StrOutputParser()).with_config(metadata={"stage": "query_hyde"})
+
+
+def _to_candidates(result: dict) -> list[str]:
+    response: ContentResponse = result["themes"]
+    logger.info(f"基于文档提取的信息{response}")
+
+    if not response.content_list:
+        return []
+    content_list = [info.extracted_content for info in response.content_list]
+    content_list.append(result["hyde"])
+    return content_list
+
+
+def build_answer_chain(retriever: BaseRetriever, chat_model: BaseChatModel = None,
+                       hyde_retrieval: bool = False) -> Runnable:
+    """候选答案链：输入问题，输出待重排序的候选答案列表
+
+    默认 HyDE 与检索 + 主题提取并行执行，只依赖问题本身；
+    hyde_retrieval 为 True 时用问题与 HyDE 答案拼接后的文本检索，两次 LLM 调用只能串行。
+    """
+    theme_chain = build_theme_chain(retriever, chat_model)
+    hyde_chain = build_hyde_chain(chat_model)
+
+    if not hyde_retrieval:
+        return RunnableParallel(themes=theme_chain, hyde=hyde_chain) | RunnableLambda(_to_candidates)
+
+    retrieval_query = RunnableLambda(lambda x: f"{x['question']}\n{x['hyde']}")
+    return (RunnableParallel(question=RunnablePassthrough(), hyde=hyde_chain)
+            | RunnablePassthrough.assign(themes=retrieval_query | theme_chain)
+            | RunnableLambda(_to_candidates))
+
+
+def get_answer_chain(retriever: BaseRetriever, chat_model: BaseChatModel = None,
+                     hyde_retrieval: bool = None) -> Runnable:
+    """返回已构建的候选答案链，同一检索器与模型只构建一次"""
+    hyde_retrieval = constant.hyde_retrieval if hyde_retrieval is None else hyde_retrieval
+    return _cached_chain(("answer", id(retriever), id(chat_model), hyde_retrieval),
+                         lambda: build_answer_chain(retriever, chat_model, hyde_retrieval))
+
+
+def query_multi_content(question: str, retriever: BaseRetriever, chat_model: BaseChatModel = None) -> ContentResponse:
+    rag_chain = _cached_chain(("theme", id(retriever), id(chat_model)),
+                              lambda: build_theme_chain(retriever, chat_model))
     result = rag_chain.invoke(question)
     logger.info(f"llm-返回结果 {result}")
     return result
 
 
-def query_hyde(question: str) -> str:
-    hyde_prompt_template = PromptTemplate.from_template(hyde_prompt)
+def query_hyde(question: str, chat_model: BaseChatModel = None) -> str:
+    rag_chain = _cached_chain(("hyde", id(chat_model)), lambda: build_hyde_chain(chat_model))
+    return rag_chain.invoke(question)
 
-    rag_chain = ({"question": RunnablePassthrough()}
-                 | hyde_prompt_template
-                 | llm
-                 | StrOutputParser())
 
-    result = rag_chain.invoke(question)
-    return result
+def init_retriever(force: bool = False) -> HybridRetriever:
+    """增量构建索引后加载检索器，PDF 未变化时直接加载已有索引"""
+    ingest_pipeline.ingest(force=force)
+    return HybridRetriever.load_hybrid_retriever()
 
 
-def answer_question(question: str):
-    init = True
+# 未指定检索器时共用的默认检索器，进程内只构建一次
+_default_retriever = registry.register("retriever", init_retriever)
 
-    if init:
-        split_docs = pdf_parse.load_and_split()
-        hybrid_retriever = HybridRetriever.create_hybrid_retriever(split_docs)
-    else:
-        hybrid_retriever = HybridRetriever.load_hybrid_retriever()
 
-    response: ContentResponse = query_multi_content(question, hybrid_retriever)
-    logger.info(f"基于文档提取的信息{response}")
+def default_retriever() -> HybridRetriever:
+    return _default_retriever.get()
 
-    if not response.content_list:
+
+def answer_candidates(question: str, retriever: BaseRetriever, chat_model: BaseChatModel = None) -> list[str]:
+    """生成待重排序的候选答案：基于文档提取的内容 + HyDE 答案，文档无有效内容时返回空列表"""
+    return get_answer_chain(retriever, chat_model).invoke(question)
+
+
+async def aanswer_candidates(question: str, retriever: BaseRetriever, chat_model: BaseChatModel = None) -> list[str]:
+    return await get_answer_chain(retriever, chat_model).ainvoke(question)
+
+
+def answer_cache_scope(retriever: BaseRetriever = None, chat_model: BaseChatModel = None,
+                       hyde_retrieval: bool = None) -> str:
+    """答案缓存的 scope：默认检索器（default_retriever）与默认模型记为 default，其余按对象区分"""
+    hyde_retrieval = constant.hyde_retrieval if hyde_retrieval is None else hyde_retrieval
+    retriever_key = "default" if retriever is None else f"{type(retriever).__name__}@{id(retriever):x}"
+    model_key = "default" if chat_model is None else f"{type(chat_model).__name__}@{id(chat_model):x}"
+    return f"{retriever_key}|{model_key}|hyde_retrieval={hyde_retrieval}"
+
+
+def answer_question(question: str, retriever: BaseRetriever = None, use_cache: bool = None,
+                    profile: bool = None):
+    """
+    Args:
+        profile: 是否对本次问答做 cProfile，默认按 constant.trace_profile_sample_rate 抽样
+    """
+    with tracing.trace_request("answer_question", profile) as trace:
+        answers = _answer_question(question, retriever, use_cache)
+    # 嵌套在外层请求中时由外层统计总耗时
+    if trace.seconds is not None:
+        logger.info(f"[trace] 问答耗时 {trace.seconds:.2f}s, 各阶段: {trace.spans}")
+    return answers
+
+
+def _answer_question(question: str, retriever: BaseRetriever = None, use_cache: bool = None):
+    use_cache = constant.answer_cache_enabled if use_cache is None else use_cache
+    scope = answer_cache_scope(retriever)
+    if use_cache:
+        with tracing.span("answer_cache"):
+            cached = answer_cache.answer_cache.lookup(question, scope)
+        if cached is not None:
+            return cached
+
+    hybrid_retriever = retriever or default_retriever()
+
+    content_list = answer_candidates(question, hybrid_retriever)
+    if not content_list:
         return
-    hyde_answer = query_hyde(question)
-    content_list = [info.extracted_content for info in response.content_list]
-    content_list.append(hyde_answer)
 
     rerank_content: list[str] = rerank_model.predict(question, content_list)
     logger.info(f"最后排序的顺序{rerank_content}")
+    if use_cache:
+        answer_cache.answer_cache.update(question, rerank_content, scope)
+    return rerank_content
 
 
 if __name__ == '__main__':
-    answer_question("如何通过中央显示屏进行副驾驶员座椅设置？")
\ No newline at end of file
+    answer_question("如何通过中央显示屏进行副驾驶员座椅设置？")
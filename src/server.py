@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiohttp import web
+
+import src.rag.llm.answer_cache as answer_cache
+import src.rag.llm.rerank_model as rerank_model
+import src.run as run
+from src import constant, global_config
+from src.config import tracing
+from src.config.resource_registry import registry
+from src.rag.llm.embedding_cache import normalize_text
+
+# 日志配置
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AnswerJob:
+    """一个问题的计算过程，事件依次追加，订阅者（含中途加入的）按顺序读取全部事件"""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.events: list[dict] = []
+        self.finished = False
+        self._changed = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+    async def publish(self, event: dict, finished: bool = False):
+        async with self._changed:
+            self.events.append(event)
+            self.finished = self.finished or finished
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.events) or self.finished)
+                events, finished = self.events[position:], self.finished
+            for event in events:
+                yield event
+            position += len(events)
+            if finished and position == len(self.events):
+                return
+
+
+class AnswerService:
+    """常驻问答服务
+
+    模型与检索器在进程内只加载一次；LLM 链路（检索 + 主题提取 + HyDE）与本地模型推理（重排序）
+    分别由信号量限制并发；同时在处理中的相同问题（归一化后）只计算一次，结果分发给所有请求方。
+    """
+
+    def __init__(self, retriever, llm_concurrency: int = None, model_concurrency: int = None):
+        self.retriever = retriever
+        self.llm_semaphore = asyncio.Semaphore(llm_concurrency or constant.server_llm_concurrency)
+        self.model_semaphore = asyncio.Semaphore(model_concurrency or constant.server_model_concurrency)
+        self._inflight: dict[str, AnswerJob] = {}
+        # 答案缓存只复用同一检索器、模型与 HyDE 配置下的答案
+        self.cache_scope = run.answer_cache_scope(retriever)
+
+        self.requests = 0
+        self.coalesced = 0
+
+    def submit(self, question: str) -> tuple[AnswerJob, bool]:
+        """返回问题对应的计算过程，以及是否与处理中的请求合并"""
+        self.requests += 1
+        key = normalize_text(question)
+        job = self._inflight.get(key)
+        if job is not None:
+            self.coalesced += 1
+            return job, True
+
+        job = AnswerJob(question)
+        self._inflight[key] = job
+        job.task = asyncio.create_task(self._run(key, job))
+        return job, False
+
+    async def _run(self, key: str, job: AnswerJob):
+        with tracing.trace_async_request("answer") as trace:
+            if tracing.sample_profile():
+                await self._answer_profiled(key, job, trace)
+            else:
+                await self._answer(key, job, trace)
+
+    def _answer_sync(self, question: str) -> list[str]:
+        # 整条同步链路在同一工作线程中执行，cProfile 只覆盖本请求
+        with tracing.profile_block("answer", constant.trace_slow_seconds):
+            return run.answer_question(question, self.retriever, profile=False) or []
+
+    async def _answer_profiled(self, key: str, job: AnswerJob, trace: tracing.RequestTrace):
+        """抽样到的请求：在线程中执行同步链路并采样，只返回最终答案"""
+        start = time.perf_counter()
+        try:
+            async with self.llm_semaphore, self.model_semaphore:
+                answers = await asyncio.to_thread(self._answer_sync, job.question)
+            await job.publish({"event": "answer", "data": answers,
+                               "elapsed": round(time.perf_counter() - start, 3),
+                               "spans": trace.spans}, finished=True)
+        except Exception as e:
+            logger.exception(f"[server] 问题处理失败: {job.question}")
+            await job.publish({"event": "error", "message": str(e)}, finished=True)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _answer(self, key: str, job: AnswerJob, trace: tracing.RequestTrace):
+        start = time.perf_counter()
+        try:
+            if constant.answer_cache_enabled:
+                cached = await asyncio.to_thread(answer_cache.answer_cache.lookup, job.question, self.cache_scope)
+                if cached is not None:
+                    await job.publish({"event": "answer", "data": cached, "cached": True,
+                                       "elapsed": round(time.perf_counter() - start, 3),
+                                       "spans": trace.spans}, finished=True)
+                    return
+
+            async with self.llm_semaphore:
+                candidates = await run.aanswer_candidates(job.question, self.retriever)
+            await job.publish({"event": "candidates", "data": candidates})
+
+            answers = []
+            if candidates:
+                async with self.model_semaphore:
+                    answers = await asyncio.to_thread(rerank_model.predict, job.question, candidates)
+                if constant.answer_cache_enabled:
+                    await asyncio.to_thread(answer_cache.answer_cache.update, job.question, answers,
+                                            self.cache_scope)
+            await job.publish({"event": "answer", "data": answers,
+                               "elapsed": round(time.perf_counter() - start, 3),
+                               "spans": trace.spans}, finished=True)
+        except Exception as e:
+            logger.exception(f"[server] 问题处理失败: {job.question}")
+            await job.publish({"event": "error", "message": str(e)}, finished=True)
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), "requests": self.requests, "coalesced": self.coalesced}
+
+
+async def handle_answer(request: web.Request) -> web.StreamResponse:
+    """POST /answer {"question": "..."}，以 NDJSON 逐行返回各阶段结果"""
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="invalid json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="body must be a json object")
+    question = body.get("question", "")
+    if not isinstance(question, str):
+        raise web.HTTPBadRequest(text="question must be a string")
+    question = question.strip()
+    if not question:
+        raise web.HTTPBadRequest(text="question is required")
+
+    service: AnswerService = request.app["service"]
+    job, coalesced = service.submit(question)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    await response.write(_ndjson({"event": "accepted", "coalesced": coalesced}))
+    # 客户端断开只取消本次订阅，计算继续进行，供合并的其他请求使用
+    async for event in job.subscribe():
+        await response.write(_ndjson(event))
+    await response.write_eof()
+    return response
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    service: AnswerService = request.app["service"]
+    llm_cache = global_config.llm_cache.stats() if registry.timings().get("llm_cache") is not None else None
+    return web.json_response({"status": "ok", **service.stats(), "resources": registry.timings(),
+                              "llm_cache": llm_cache,
+                              "answer_cache": answer_cache.answer_cache.stats() if constant.answer_cache_enabled else None})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """GET /metrics 返回 Prometheus 文本格式，?format=json 返回 JSON"""
+    if request.query.get("format") == "json":
+        return web.json_response(tracing.metrics.to_json())
+    return web.Response(text=tracing.metrics.to_prometheus(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _service_resources() -> list[str]:
+    """问答链路用到的资源；检索器及其嵌入模型已在 default_retriever 中加载"""
+    names = ["llm", "rerank_tokenizer", "rerank_model"]
+    if constant.answer_cache_enabled:
+        names.append("answer_cache")
+    return names
+
+
+async def _startup(app: web.Application):
+    # 建索引与加载检索器是阻塞操作，放到线程中执行
+    retriever = await asyncio.to_thread(run.default_retriever)
+    # 预先加载模型与客户端，避免首批请求承担加载耗时
+    timings = await asyncio.to_thread(registry.warmup, _service_resources())
+    app["service"] = AnswerService(retriever)
+    logger.info(f"[server] 检索器与模型已加载: {timings}")
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.on_startup.append(_startup)
+    app.router.add_post("/answer", handle_answer)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=constant.server_host, port=constant.server_port)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 项目以 src. 前缀导入，测试从仓库根目录运行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ZHI_ZENG_API_KEY", "test")
+os.environ.setdefault("BASE_URL", "http://localhost")
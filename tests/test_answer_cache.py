@@ -0,0 +1,40 @@
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.rag.llm.answer_cache import SemanticAnswerCache
+from src.rag.llm.answer_cache_eval import recommend_threshold, threshold_report
+
+
+class _CharEmbeddings(Embeddings):
+    """按字符计数的向量，字面相近的问题相似度高"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.zeros(64, dtype=np.float32)
+        for char in text:
+            vector[ord(char) % 64] += 1
+        return vector.tolist()
+
+
+def test_lookup_only_matches_entries_from_the_same_scope():
+    cache = SemanticAnswerCache(_CharEmbeddings(), threshold=0.9)
+    cache.update("如何打开车辆尾门？", ["remote"], scope="remote")
+    cache.update("如何打开车辆尾门？", ["local"], scope="local")
+
+    assert cache.lookup("如何打开车辆尾门？", scope="remote") == ["remote"]
+    assert cache.lookup("如何打开车辆尾门", scope="local") == ["local"]
+    assert cache.lookup("如何打开车辆尾门？", scope="hyde") is None
+
+
+def test_recommended_threshold_rejects_every_non_paraphrase_pair():
+    similarities = np.asarray([0.97, 0.93, 0.905, 0.88])
+    labels = np.asarray([True, True, False, False])
+
+    threshold = recommend_threshold(similarities, labels)
+    [row] = threshold_report(similarities, labels, [threshold])
+
+    assert threshold == 0.91
+    assert row["false_positives"] == 0
+    assert row["recall"] == 1.0
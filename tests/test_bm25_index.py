@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from src.rag.retriever.bm25_index import BM25Index, BM25IndexBuilder
+
+_WORDS = ["座椅", "加热", "尾门", "打开", "方向盘", "调节", "FCTA", "usb", "接口"]
+
+
+def _build(path: str, docs: list[Document], **kwargs) -> BM25Index:
+    builder = BM25IndexBuilder(path, **kwargs)
+    for i in range(0, len(docs), 7):
+        builder.add(docs[i:i + 7])
+    return builder.finish()
+
+
+@pytest.mark.parametrize("spill_postings", [1, 5])
+def test_spilled_postings_build_the_same_index(tmp_path, spill_postings):
+    rng = np.random.default_rng(0)
+    docs = [Document(page_content=" ".join(rng.choice(_WORDS, rng.integers(1, 20))), metadata={"chunk_id": str(i)})
+            for i in range(100)]
+
+    reference = _build(str(tmp_path / "reference"), docs)
+    spilled = _build(str(tmp_path / "spilled"), docs, spill_postings=spill_postings)
+
+    for name in ("term_hashes", "term_offsets", "postings_docs", "postings_tfs", "idf", "doc_lens", "doc_offsets"):
+        assert np.array_equal(getattr(reference, name), getattr(spilled, name)), name
+    assert spilled.search("座椅加热", k=3) == reference.search("座椅加热", k=3)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from src.rag.retriever import faiss_handler
+
+
+class _UnusedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        raise AssertionError("vectors are precomputed")
+
+    def embed_query(self, text):
+        raise AssertionError("vectors are precomputed")
+
+
+def _store(vectors: np.ndarray, index_type: str):
+    ids = [f"c{i}" for i in range(len(vectors))]
+    return faiss_handler.create_vectorstore(
+        [(chunk_id, vector.tolist()) for chunk_id, vector in zip(ids, vectors)],
+        _UnusedEmbeddings(), [{"chunk_id": chunk_id} for chunk_id in ids], ids, index_type,
+    )
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_merge_delete_add_keeps_ids_consistent(index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(120, 16)).astype(np.float32)
+    store = _store(vectors, index_type)
+
+    added = rng.normal(size=(1, 16)).astype(np.float32)
+    store = faiss_handler.merge_vectorstore(store, [("new", added[0].tolist())], [{"chunk_id": "new"}], ["new"],
+                                            stale_ids=["c3"], index_type=index_type)
+    # 探查全部聚类 / 加大候选队列，排除近似检索本身的误差
+    faiss_handler.configure_search(store.index, nprobe=1024, ef_search=256)
+
+    expected = [f"c{i}" for i in range(len(vectors)) if i != 3] + ["new"]
+    queries = np.vstack([np.delete(vectors, 3, axis=0), added])
+    results = faiss_handler.batch_search(store, queries, k=1)
+
+    assert [hits[0][0].page_content for hits in results] == expected
+    assert "c3" not in store.index_to_docstore_id.values()
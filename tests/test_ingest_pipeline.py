@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src import constant
+from src.rag.loader import ingest_pipeline
+from src.rag.retriever import faiss_handler
+
+
+class _FixedEmbeddings(Embeddings):
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % 2 ** 32)
+        return rng.normal(size=self.dim).tolist()
+
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "faiss_index")
+    monkeypatch.setattr(constant, "faiss_store_path", path)
+    return path
+
+
+def _docs(ids):
+    return [Document(page_content=f"text {chunk_id}", metadata={"chunk_id": chunk_id}) for chunk_id in ids]
+
+
+def test_faiss_sink_rebuilds_legacy_index_built_with_another_model(store_path, monkeypatch):
+    # 旧版索引：openai 嵌入的 L2 索引，uuid 作为 id，没有嵌入模型记录
+    legacy = FAISS.from_texts(["legacy a", "legacy b"], _FixedEmbeddings(12), ids=["uuid-a", "uuid-b"])
+    legacy.save_local(store_path)
+
+    monkeypatch.setattr(constant, "faiss_embed_model", "m3e-large")
+    monkeypatch.setattr(faiss_handler, "get_embed_model", lambda: _FixedEmbeddings(8))
+    assert not faiss_handler.embedding_matches()
+
+    sink = ingest_pipeline.FaissSink()
+    docs = _docs(["c1", "c2", "c3"])
+    sink.write(docs, sink.embeddings.embed_documents([doc.page_content for doc in docs]))
+    sink.close()
+
+    assert faiss_handler.embedding_matches()
+    assert faiss_handler.load_embedding_info() == {"model": "m3e-large", "dim": 8}
+    store = faiss_handler.load_existing_vectorstore()
+    assert store.index.d == 8
+    assert sorted(store.index_to_docstore_id.values()) == ["c1", "c2", "c3"]
+
+
+def test_merge_rejects_vectors_of_a_different_dimension(store_path):
+    store = faiss_handler.create_vectorstore([("a", [1.0, 0.0, 0.0])], _FixedEmbeddings(3), [{}], ["a"])
+    with pytest.raises(ValueError, match="dimension"):
+        faiss_handler.merge_vectorstore(store, [("b", [1.0, 0.0])], [{}], ["b"], [])
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_faiss_sink_updates_existing_index(store_path, monkeypatch, index_type):
+    embeddings = _FixedEmbeddings(8)
+    monkeypatch.setattr(constant, "faiss_index_type", index_type)
+    monkeypatch.setattr(faiss_handler, "get_embed_model", lambda: embeddings)
+    existing = _docs([f"c{i}" for i in range(60)])
+    faiss_handler.save_store(faiss_handler.create_vectorstore(
+        [(doc.page_content, embeddings.embed_query(doc.page_content)) for doc in existing],
+        embeddings, [doc.metadata for doc in existing], [doc.metadata["chunk_id"] for doc in existing], index_type))
+
+    sink = ingest_pipeline.FaissSink()
+    # 分两批写入，其中 c5 覆盖已有分块
+    for batch in (_docs(["n1", "c5"]), _docs(["n2", "n3"])):
+        sink.write(batch, embeddings.embed_documents([f"new {doc.page_content}" for doc in batch]))
+    sink.delete(["c0", "c1"])
+    sink.close()
+
+    store = faiss_handler.load_existing_vectorstore()
+    faiss_handler.configure_search(store.index, nprobe=1024)
+    expected = sorted([f"c{i}" for i in range(2, 60)] + ["n1", "n2", "n3"])
+    assert sorted(store.index_to_docstore_id.values()) == expected
+    assert store.index.ntotal == len(expected)
+    [[(doc, _)]] = faiss_handler.batch_search(store, [embeddings.embed_query("new text c5")], k=1)
+    assert doc.metadata["chunk_id"] == "c5"